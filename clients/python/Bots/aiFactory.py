@@ -1,14 +1,25 @@
+from importlib import import_module
+
 from Bots.bot_ai import BotAI
-from Bots.my_ai import MyAI
-from Bots.stayinalign_ai import StayinAlignAI
-from Bots.stayinalign_ai_old import StayinAlignAIOld
 
+# "module:Class" per bot name. a module is only imported once its bot is created, a new or
+# experimental bot costs the others nothing at startup.
 ai_bots = {
-    "MyAI": MyAI,
-    "StayinAlignAI": StayinAlignAI,
-    "StayinAlignAIOld": StayinAlignAIOld
+    "MyAI": "Bots.my_ai:MyAI",
+    "StayinAlignAI": "Bots.stayinalign_ai:StayinAlignAI",
+    "StayinAlignAIOld": "Bots.stayinalign_ai_old:StayinAlignAIOld"
 }
 
+_classes = {}
+
+
+def bot_class(bot_selection):
+    cls = _classes.get(bot_selection)
+    if cls is None:
+        module_name, class_name = ai_bots[bot_selection].split(":")
+        cls = _classes[bot_selection] = getattr(import_module(module_name), class_name)
+    return cls
+
 
 def ai_factory(bot_selection="MyAI") -> BotAI:
-    return ai_bots[bot_selection]()
+    return bot_class(bot_selection)()
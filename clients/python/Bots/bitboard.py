@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+import os
+import random
+from typing import List
+
+from Bots.table_cache import load_tables, signature
+
+# bitboard layout: every column uses HEIGHT + 1 bits, bit (col * COLUMN_BITS + row) is the
+# cell board[row][col] of a PlayState. the extra bit on top of each column stays empty and
+# keeps the shift based line checks from wrapping into the next column.
+#
+#   6 13 20 27 34 41 48
+#   5 12 19 26 33 40 47
+#   ...
+#   0  7 14 21 28 35 42
+
+WIDTH = 7
+HEIGHT = 6
+COLUMN_BITS = HEIGHT + 1
+BOMB_ID = 99
+CENTER_ORDER = (3, 2, 4, 1, 5, 0, 6)
+
+BOTTOM_MASK = sum(1 << (col * COLUMN_BITS) for col in range(WIDTH))
+COLUMN_MASKS = tuple(((1 << HEIGHT) - 1) << (col * COLUMN_BITS) for col in range(WIDTH))
+BOARD_MASK = sum(COLUMN_MASKS)
+
+# CELL_BITS[col * COLUMN_BITS + row] is the single bit of that cell
+CELL_BITS = tuple(1 << index for index in range(WIDTH * COLUMN_BITS))
+
+
+def _row_zobrist(keys, row, cells):
+    key = 0
+    for col in range(WIDTH):
+        if cells >> col & 1:
+            key ^= keys[col * COLUMN_BITS + row]
+    return key
+
+
+def _column_zobrist(keys, col, cells):
+    key = 0
+    for row in range(HEIGHT):
+        if cells >> row & 1:
+            key ^= keys[col * COLUMN_BITS + row]
+    return key
+
+
+def cell_bit(row: int, col: int) -> int:
+    return 1 << (col * COLUMN_BITS + row)
+
+
+def _cross_mask(index: int) -> int:
+    # bomb cell plus its four neighbours, the blast of board.gd update_after_detonation
+    col, row = divmod(index, COLUMN_BITS)
+    mask = 0
+    for d_row, d_col in ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)):
+        r = row + d_row
+        c = col + d_col
+        if 0 <= r < HEIGHT and 0 <= c < WIDTH:
+            mask |= cell_bit(r, c)
+    return mask
+
+
+def _compact(occupied: int, values: int) -> int:
+    # pack the bits of values that sit on occupied cells down to the bottom of the column
+    result = 0
+    target = 0
+    for row in range(HEIGHT):
+        if occupied >> row & 1:
+            if values >> row & 1:
+                result |= 1 << target
+            target += 1
+    return result
+
+
+# the fixed seed keeps zobrist hashes stable between runs so they can be stored on disk
+ZOBRIST_SEED = 0x4C0E7
+CELLS = WIDTH * COLUMN_BITS
+ROW_BITS = (1 << WIDTH) - 1
+# the tables below as flat arrays, in the order of tables.bin (make_tables.py writes it)
+TABLES_PATH = os.path.join(os.path.dirname(__file__), "tables.bin")
+TABLE_LAYOUT = (
+    ("zobrist", "Q", 3 * CELLS),
+    ("round_keys", "Q", 128),
+    ("side_keys", "Q", 2),
+    ("explode_keys", "Q", 128),
+    ("row_spread", "Q", ROW_BITS + 1),
+    ("row_zobrist", "Q", 3 * HEIGHT * (ROW_BITS + 1)),
+    ("column_zobrist", "Q", WIDTH * 3 * (1 << HEIGHT)),
+    ("cross_masks", "Q", CELLS),
+    ("gravity", "B", 1 << (2 * HEIGHT)),
+)
+TABLES_SIGNATURE = signature(WIDTH, HEIGHT, ZOBRIST_SEED, TABLE_LAYOUT)
+
+
+def compute_tables():
+    # {name: list} of every table in TABLE_LAYOUT, the way tables.bin was made. the random
+    # numbers are drawn in a fixed order, changing it changes every hash (and the book keys).
+    rng = random.Random(ZOBRIST_SEED)
+    zobrist = [rng.getrandbits(64) for _ in range(3 * CELLS)]
+    round_keys = [rng.getrandbits(64) for _ in range(128)]
+    side_keys = [rng.getrandbits(64) for _ in range(2)]
+    explode_keys = [rng.getrandbits(64) for _ in range(128)]
+    kind_keys = [zobrist[kind * CELLS:(kind + 1) * CELLS] for kind in range(3)]
+    return {
+        "zobrist": zobrist,
+        "round_keys": round_keys,
+        "side_keys": side_keys,
+        "explode_keys": explode_keys,
+        "row_spread": [sum(1 << (col * COLUMN_BITS) for col in range(WIDTH) if cells >> col & 1)
+                       for cells in range(ROW_BITS + 1)],
+        "row_zobrist": [_row_zobrist(kind_keys[kind], row, cells) for kind in range(3)
+                        for row in range(HEIGHT) for cells in range(ROW_BITS + 1)],
+        "column_zobrist": [_column_zobrist(kind_keys[kind], col, cells) for col in range(WIDTH)
+                           for kind in range(3) for cells in range(1 << HEIGHT)],
+        "cross_masks": [_cross_mask(index) for index in range(CELLS)],
+        "gravity": [_compact(index >> HEIGHT, index & ((1 << HEIGHT) - 1)) for index in range(1 << (2 * HEIGHT))],
+    }
+
+
+def _split(values, size):
+    return tuple(tuple(values[start:start + size]) for start in range(0, len(values), size))
+
+
+# loading the file is a fraction of computing the tables, a bot starts faster
+_tables = load_tables(TABLES_PATH, TABLE_LAYOUT, TABLES_SIGNATURE) or compute_tables()
+
+# zobrist keys per cell for coin 1, coin 2 and bomb
+ZOBRIST = _split(_tables["zobrist"], CELLS)
+ZOBRIST_BOMB = ZOBRIST[0]
+# ROUND_KEYS[round] and SIDE_KEYS[coin_id] complete a search key, see transposition.py
+ROUND_KEYS = tuple(_tables["round_keys"])
+SIDE_KEYS = (0, *_tables["side_keys"])
+EXPLODE_KEYS = tuple(_tables["explode_keys"])
+
+# Position.from_cells: ROW_SPREAD[cells] puts bit col of a board row at the bottom cell of
+# column col, ROW_ZOBRIST[kind][row][cells] is the hash of those cells in that row
+ROW_SPREAD = tuple(_tables["row_spread"])
+CELL_KIND_TABLES = (bytes.maketrans(b"0129", b"0001"), bytes.maketrans(b"0129", b"0100"),
+                    bytes.maketrans(b"0129", b"0010"))
+ROW_ZOBRIST = tuple(_split(rows, ROW_BITS + 1) for rows in _split(_tables["row_zobrist"], HEIGHT * (ROW_BITS + 1)))
+
+# COLUMN_ZOBRIST[col][kind][cells] is the hash of the cells of one column, an explosion
+# rehashes only the columns it touched
+COLUMN_ZOBRIST = tuple(_split(kinds, 1 << HEIGHT) for kinds in _split(_tables["column_zobrist"], 3 << HEIGHT))
+
+# bomb cell plus its four neighbours per cell index
+CROSS_MASKS = tuple(_tables["cross_masks"])
+
+# GRAVITY[occupied << HEIGHT | values] is values after the column fell together
+GRAVITY = tuple(_tables["gravity"])
+del _tables
+
+
+def zobrist_hash(stones1: int, stones2: int, bomb: int) -> int:
+    key = 0
+    for kind, mask in ((1, stones1), (2, stones2), (0, bomb)):
+        keys = ZOBRIST[kind]
+        while mask:
+            low = mask & -mask
+            key ^= keys[low.bit_length() - 1]
+            mask ^= low
+    return key
+
+
+def cross_mask(row: int, col: int) -> int:
+    return CROSS_MASKS[col * COLUMN_BITS + row]
+
+
+def has_four(stones: int) -> bool:
+    # vertical
+    m = stones & (stones >> 1)
+    if m & (m >> 2):
+        return True
+    # horizontal
+    m = stones & (stones >> 7)
+    if m & (m >> 14):
+        return True
+    # diagonal \
+    m = stones & (stones >> 6)
+    if m & (m >> 12):
+        return True
+    # diagonal /
+    m = stones & (stones >> 8)
+    if m & (m >> 16):
+        return True
+    return False
+
+
+def winning_cells(stones: int, occupied: int) -> int:
+    # every empty cell that completes four in a row for stones, playable or not
+    # vertical: only the cell on top of three stones can ever be filled
+    cells = (stones << 1) & (stones << 2) & (stones << 3)
+    for shift in (7, 6, 8):
+        pair = (stones << shift) & (stones << 2 * shift)
+        cells |= pair & (stones << 3 * shift)
+        cells |= pair & (stones >> shift)
+        pair = (stones >> shift) & (stones >> 2 * shift)
+        cells |= pair & (stones << shift)
+        cells |= pair & (stones >> 3 * shift)
+    return cells & (BOARD_MASK ^ occupied)
+
+
+def playable_cells(occupied: int) -> int:
+    # lowest free cell of every column that is not full
+    return (occupied + BOTTOM_MASK) & BOARD_MASK
+
+
+def column_of(bit: int) -> int:
+    return (bit.bit_length() - 1) // COLUMN_BITS
+
+
+def mirror(mask: int) -> int:
+    # the same cells with the columns in reverse order (column col becomes WIDTH - 1 - col)
+    mirrored = 0
+    for col in range(WIDTH):
+        mirrored |= (mask >> (col * COLUMN_BITS) & COLUMN_MASKS[0]) << ((WIDTH - 1 - col) * COLUMN_BITS)
+    return mirrored
+
+
+class Position:
+    # stones is indexed by coin_id (1 or 2), index 0 is unused so the coin ids of the
+    # server can be used directly. bomb holds the cells occupied by bombs (BOMB_ID).
+    # hash is the zobrist hash of all cells and is kept up to date by every move.
+    # threats[coin_id] is the threat map of that coin: every cell that completes four in a row
+    # with its stones, empty or not. play() only has to redo the map of the mover (the stones
+    # of the other coin did not change), undo() takes the old map back from _threat_stack.
+    __slots__ = ("stones", "bomb", "occupied", "heights", "hash", "threats", "_threat_stack")
+
+    def __init__(self, stones=None, bomb=0, heights=None, hash=None, threats=None):
+        self.stones = stones if stones is not None else [0, 0, 0]
+        self.bomb = bomb
+        self.occupied = self.stones[1] | self.stones[2] | bomb
+        if heights is None:
+            heights = [((self.occupied >> (col * COLUMN_BITS)) & 63).bit_length() for col in range(WIDTH)]
+        self.heights = heights
+        self.hash = hash if hash is not None else zobrist_hash(self.stones[1], self.stones[2], bomb)
+        if threats is None:
+            threats = [0, winning_cells(self.stones[1], 0), winning_cells(self.stones[2], 0)]
+        self.threats = threats
+        self._threat_stack = []
+
+    @classmethod
+    def from_board(cls, board: List[List[int]]) -> Position:
+        stones = [0, 0, 0]
+        bomb = 0
+        for row, cells in enumerate(board):
+            for col, value in enumerate(cells):
+                if value == 0:
+                    continue
+                bit = 1 << (col * COLUMN_BITS + row)
+                if value == BOMB_ID:
+                    bomb |= bit
+                else:
+                    stones[value] |= bit
+        return cls(stones, bomb)
+
+    @classmethod
+    def from_cells(cls, cells: bytes) -> Position:
+        # one character per cell in the order of the json board (board[0][0], board[0][1], ...):
+        # b"0" empty, b"1"/b"2" coins, b"9" bomb. int() turns each kind into a row by row mask,
+        # the tables below move it into the column layout and hash it seven cells at a time.
+        stones = [0, 0, 0]
+        key = 0
+        for kind in (1, 2, 0):
+            cells_of_kind = int(cells.translate(CELL_KIND_TABLES[kind])[::-1], 2)
+            if not cells_of_kind:
+                continue
+            mask = 0
+            row_keys = ROW_ZOBRIST[kind]
+            for row in range(HEIGHT):
+                row_cells = cells_of_kind >> (row * WIDTH) & ROW_BITS
+                if row_cells:
+                    mask |= ROW_SPREAD[row_cells] << row
+                    key ^= row_keys[row][row_cells]
+            stones[kind] = mask
+        bomb = stones[0]
+        stones[0] = 0
+        return cls(stones, bomb, hash=key)
+
+    def to_board(self) -> List[List[int]]:
+        board = [[0] * WIDTH for _ in range(HEIGHT)]
+        for row in range(HEIGHT):
+            for col in range(WIDTH):
+                bit = 1 << (col * COLUMN_BITS + row)
+                if self.stones[1] & bit:
+                    board[row][col] = 1
+                elif self.stones[2] & bit:
+                    board[row][col] = 2
+                elif self.bomb & bit:
+                    board[row][col] = BOMB_ID
+        return board
+
+    def copy(self) -> Position:
+        return Position(self.stones[:], self.bomb, self.heights[:], self.hash, self.threats[:])
+
+    def can_play(self, col: int) -> bool:
+        return self.heights[col] < HEIGHT
+
+    def legal_columns(self) -> List[int]:
+        heights = self.heights
+        return [col for col in range(WIDTH) if heights[col] < HEIGHT]
+
+    def legal_mask(self) -> int:
+        return playable_cells(self.occupied)
+
+    def next_bit(self, col: int) -> int:
+        return CELL_BITS[col * COLUMN_BITS + self.heights[col]]
+
+    def play(self, col: int, coin_id: int) -> int:
+        index = col * COLUMN_BITS + self.heights[col]
+        bit = CELL_BITS[index]
+        stones = self.stones[coin_id] | bit
+        self.stones[coin_id] = stones
+        self.occupied |= bit
+        self.heights[col] += 1
+        self.hash ^= ZOBRIST[coin_id][index]
+        self._threat_stack.append(self.threats[coin_id])
+        self.threats[coin_id] = winning_cells(stones, 0)
+        return bit
+
+    def undo(self, col: int, coin_id: int):
+        self.heights[col] -= 1
+        index = col * COLUMN_BITS + self.heights[col]
+        bit = CELL_BITS[index]
+        self.stones[coin_id] ^= bit
+        self.occupied ^= bit
+        self.hash ^= ZOBRIST[coin_id][index]
+        self.threats[coin_id] = self._threat_stack.pop()
+
+    def drop_bomb(self, col: int) -> int:
+        # a bomb falls like a coin, see game.gd _spawn_bomb
+        index = col * COLUMN_BITS + self.heights[col]
+        bit = CELL_BITS[index]
+        self.bomb |= bit
+        self.occupied |= bit
+        self.heights[col] += 1
+        self.hash ^= ZOBRIST_BOMB[index]
+        return bit
+
+    def lift_bomb(self, col: int):
+        # takes back drop_bomb(col)
+        self.heights[col] -= 1
+        index = col * COLUMN_BITS + self.heights[col]
+        bit = CELL_BITS[index]
+        self.bomb ^= bit
+        self.occupied ^= bit
+        self.hash ^= ZOBRIST_BOMB[index]
+
+    def is_winning_move(self, col: int, coin_id: int) -> bool:
+        return bool(self.threats[coin_id] & CELL_BITS[col * COLUMN_BITS + self.heights[col]])
+
+    def has_won(self, coin_id: int) -> bool:
+        return has_four(self.stones[coin_id])
+
+    def winners(self) -> List[int]:
+        # same as board.gd detect_winner_full_scan, both players can win by one explosion
+        return [coin_id for coin_id in (1, 2) if has_four(self.stones[coin_id])]
+
+    def winning_cells(self, coin_id: int) -> int:
+        # empty cells that complete four in a row for coin_id, playable or not
+        return self.threats[coin_id] & ~self.occupied
+
+    def winning_moves(self, coin_id: int) -> int:
+        # playable cells that win immediately for coin_id
+        return self.threats[coin_id] & playable_cells(self.occupied)
+
+    def save(self):
+        return self.stones[1], self.stones[2], self.bomb, self.heights[:], self.hash, self.threats[1], self.threats[2]
+
+    def restore(self, saved):
+        self.stones[1], self.stones[2], self.bomb, heights, self.hash, self.threats[1], self.threats[2] = saved
+        self.occupied = self.stones[1] | self.stones[2] | self.bomb
+        self.heights[:] = heights
+
+    def explode(self, row: int, col: int):
+        # board.gd update_after_detonation followed by _apply_gravity, returns the state
+        # before the explosion so the caller can restore() it
+        saved = self.save()
+        self.detonate(CROSS_MASKS[col * COLUMN_BITS + row])
+        return saved
+
+    def detonate(self, blast: int):
+        # only the columns the blast touched change: their cells are cleared, fall together
+        # through the GRAVITY table and are hashed again, like a few moves at once
+        stones = self.stones
+        heights = self.heights
+        one = stones[1]
+        two = stones[2]
+        bomb = self.bomb
+        key = self.hash
+        for col in range(WIDTH):
+            if not blast & COLUMN_MASKS[col]:
+                continue
+            shift = col * COLUMN_BITS
+            column_keys = COLUMN_ZOBRIST[col]
+            one_cells = one >> shift & 63
+            two_cells = two >> shift & 63
+            bomb_cells = bomb >> shift & 63
+            key ^= column_keys[1][one_cells] ^ column_keys[2][two_cells] ^ column_keys[0][bomb_cells]
+            keep = ~blast >> shift & 63
+            one_cells &= keep
+            two_cells &= keep
+            bomb_cells &= keep
+            occ = one_cells | two_cells | bomb_cells
+            heights[col] = occ.bit_count()
+            if occ & (occ + 1):
+                # holes, the cells above them fall down
+                index = occ << HEIGHT
+                one_cells = GRAVITY[index | one_cells]
+                two_cells = GRAVITY[index | two_cells]
+                bomb_cells = GRAVITY[index | bomb_cells]
+            key ^= column_keys[1][one_cells] ^ column_keys[2][two_cells] ^ column_keys[0][bomb_cells]
+            clear = ~COLUMN_MASKS[col]
+            one = one & clear | one_cells << shift
+            two = two & clear | two_cells << shift
+            bomb = bomb & clear | bomb_cells << shift
+        # the threat map of a coin whose stones moved is built again
+        if one != stones[1]:
+            stones[1] = one
+            self.threats[1] = winning_cells(one, 0)
+        if two != stones[2]:
+            stones[2] = two
+            self.threats[2] = winning_cells(two, 0)
+        self.bomb = bomb
+        self.occupied = one | two | bomb
+        self.hash = key
+
+    def count(self) -> int:
+        return self.occupied.bit_count()
+
+    def __eq__(self, other):
+        return (isinstance(other, Position) and self.stones[1] == other.stones[1]
+                and self.stones[2] == other.stones[2] and self.bomb == other.bomb)
+
+    def __repr__(self):
+        rows = ["".join("B" if value == BOMB_ID else ".XO"[value] for value in row)
+                for row in self.to_board()[::-1]]
+        return "\n".join(rows)
@@ -9,3 +9,32 @@ class BotAI(ABC):
     @abstractmethod
     def get_name(self):
         pass
+
+    def start_clock(self, started_at):
+        # called by the client with the perf_counter() time a message for this bot arrived
+        pass
+
+    def start_pondering(self):
+        # called by the client once the answer is sent, the opponent's turn is free to use
+        pass
+
+    def stop_pondering(self):
+        # called by the client before it shuts down
+        pass
+
+    def best_move_so_far(self):
+        # optional: the column a running play() would send right now, or None. bot.py asks for
+        # it from the main thread when the search overruns the deadline.
+        return None
+
+    def stop(self):
+        # called from the main thread after the deadline, a running play() should return soon
+        pass
+
+    def on_new_game(self):
+        # called before the first move of every game, tables kept from move to move are cleared here
+        pass
+
+    def report_search(self):
+        # optional: a dict with the "depth" reached and "nodes" searched for the last move, or None
+        return None
@@ -1,25 +1,106 @@
 from __future__ import annotations
 
+import json
+import re
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from Bots.bitboard import HEIGHT, WIDTH, Position
 
 
 class FromServerPacket(ABC):
+    __slots__ = ()
+
     @staticmethod
     @abstractmethod
     def from_dict(data: dict) -> FromServerPacket:
         pass
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PlayState(FromServerPacket):
+    # position is the board in the engine's bitboard form, board builds the old list of rows
+    # (board[row][col], row 0 at the bottom) on first use for bots that still want it
     bot: str
     coin_id: int
     round: int
-    bombs: [dict[str, int]]
-    board: List[List[int]]
+    bombs: Tuple[dict, ...]
+    position: Position
+    _board: Optional[List[List[int]]] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def board(self) -> List[List[int]]:
+        if self._board is None:
+            object.__setattr__(self, "_board", self.position.to_board())
+        return self._board
 
     @staticmethod
     def from_dict(data: dict) -> PlayState:
-        return PlayState(data["bot"], data["coin_id"], data["round"], data["bombs"], data["board"])
+        return PlayState(data["bot"], data["coin_id"], data["round"], tuple(data["bombs"]),
+                         Position.from_board(data["board"]))
+
+    @staticmethod
+    def from_frame(frame: bytes) -> PlayState:
+        # reads the fields straight from the json bytes the server sent, the slow path is only
+        # used if the message does not look like game.gd _send_update_state
+        state = _parse_frame(frame)
+        if state is None:
+            state = PlayState.from_dict(json.loads(frame.decode("utf-8").replace("'", '"')))
+        return state
+
+
+# game.gd sends JSON.stringify(payload) with double quotes, the key order is not guaranteed.
+# bytes.find locates every key, the values are read from there. a string with a backslash
+# does not match, json escapes are left to json.loads.
+_BOT_KEY = b'"bot"'
+_STRING = re.compile(rb'\s*:\s*"([^"\\]*)"')
+_NUMBER = re.compile(rb"\s*:\s*(\d+)")
+_BOARD_END = re.compile(rb"\]\s*\]")
+_BOMB = re.compile(rb"\{[^}]*\}")
+_BOMB_FIELD = re.compile(rb'"(\w+)"\s*:\s*(\d+)')
+_BOARD_NOISE = b"[]:, \t\r\n"
+
+
+def is_ping(frame) -> bool:
+    # the first frame after connecting is not a game state, every game state is a json object
+    return frame.lstrip()[:1] not in (b"{", "{")
+
+
+def bot_name_of(frame: bytes) -> Optional[bytes]:
+    # cheap look at the addressee, nothing else of the message is parsed
+    index = frame.find(_BOT_KEY)
+    match = _STRING.match(frame, index + len(_BOT_KEY)) if index >= 0 else None
+    if match is None:
+        # not the format of game.gd, let the full parser decide
+        return PlayState.from_frame(frame).bot.encode("utf-8")
+    return match.group(1)
+
+
+def _parse_frame(frame: bytes) -> Optional[PlayState]:
+    bot = _value(frame, _BOT_KEY, _STRING)
+    coin_id = _value(frame, b'"coin_id"', _NUMBER)
+    current_round = _value(frame, b'"round"', _NUMBER)
+    board_start = frame.find(b'"board"')
+    bombs_start = frame.find(b'"bombs"')
+    if bot is None or coin_id is None or current_round is None or board_start < 0 or bombs_start < 0:
+        return None
+    board_end = _BOARD_END.search(frame, board_start)
+    bombs_end = frame.find(b"]", bombs_start)
+    if board_end is None or bombs_end < 0:
+        return None
+    # one character per cell, the bomb id 99 becomes 9
+    cells = frame[board_start + 7:board_end.end()].replace(b"99", b"9").translate(None, _BOARD_NOISE)
+    if len(cells) != WIDTH * HEIGHT or cells.translate(None, b"0129"):
+        return None
+    bombs = tuple({key.decode(): int(value) for key, value in _BOMB_FIELD.findall(bomb.group(0))}
+                  for bomb in _BOMB.finditer(frame, bombs_start, bombs_end))
+    return PlayState(bot.decode("utf-8"), int(coin_id), int(current_round), bombs, Position.from_cells(cells))
+
+
+def _value(frame, key, pattern):
+    index = frame.find(key)
+    if index < 0:
+        return None
+    match = pattern.match(frame, index + len(key))
+    return match.group(1) if match else None
@@ -0,0 +1,153 @@
+from Bots.bitboard import CENTER_ORDER, COLUMN_MASKS, HEIGHT, WIDTH, column_of, playable_cells, winning_cells
+from Bots.search import TIME_CHECK_INTERVAL
+
+# game.gd drops the last bomb at a turn of 25-30, from then on the board only changes by moves
+LAST_SPAWN_TURN = 30
+# the solver takes over from this many empty cells on, 24 empty cells take up to ~400 ms
+ENDGAME_EMPTY_CELLS = 22
+# share of the remaining move time the solver may use before the search takes over
+ENDGAME_TIME_SHARE = 0.6
+# the cache is cleared when it grows past this many positions
+MAX_CACHE_ENTRIES = 1_000_000
+
+_EXACT = 0
+_LOWER = 1
+_UPPER = 2
+
+
+def endgame_ready(position, bombs, current_round, max_empty=ENDGAME_EMPTY_CELLS):
+    # no bomb is pending or can still drop, and few enough cells are left to solve the rest
+    if bombs or position.bomb or current_round < LAST_SPAWN_TURN:
+        return False
+    return WIDTH * HEIGHT - position.count() <= max_empty
+
+
+class EndgameSolver:
+    # exact negamax for positions without bombs. there is no draw: a player who finds the
+    # board full on their turn cannot play a legal column and loses (game.gd _spawn).
+    # values are from the view of the player to move, e empty cells before their move:
+    #   winning with this move     +e
+    #   losing to the next move    -(e - 1)
+    #   losing on a full board     -1
+    # so a positive value is a proven win and quicker wins score higher.
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES):
+        self.cache = {}
+        self.max_entries = max_entries
+        self.nodes = 0
+        self.clock = None
+
+    def clear(self):
+        self.cache.clear()
+
+    def solve(self, position, coin_id, clock):
+        # returns (value, column) for coin_id to move, clock.check() raises SearchTimeout
+        if len(self.cache) > self.max_entries:
+            self.cache.clear()
+        self.clock = clock
+        self.nodes = 0
+        me = position.stones[coin_id]
+        occupied = position.occupied
+        empty = WIDTH * HEIGHT - occupied.bit_count()
+        possible = playable_cells(occupied)
+        wins = winning_cells(me, occupied) & possible
+        if wins:
+            return empty, column_of(wins & -wins)
+
+        best_value = None
+        best_column = None
+        alpha = -WIDTH * HEIGHT
+        for bit in self._ordered_moves(me, occupied, possible):
+            value = -self._negamax(me ^ occupied, occupied | bit, empty - 1, -WIDTH * HEIGHT, -alpha)
+            if best_value is None or value > best_value:
+                best_value = value
+                best_column = column_of(bit)
+                alpha = max(alpha, value)
+        return best_value, best_column
+
+    def _negamax(self, me, occupied, empty, alpha, beta):
+        self.nodes += 1
+        if not self.nodes % TIME_CHECK_INTERVAL:
+            self.clock.check()
+        if empty == 0:
+            return -1
+        if empty == 1:
+            # the last cell: either it wins or the opponent finds the board full
+            return 1
+        possible = playable_cells(occupied)
+        if winning_cells(me, occupied) & possible:
+            return empty
+
+        opponent = me ^ occupied
+        opponent_wins = winning_cells(opponent, occupied)
+        forced = possible & opponent_wins
+        if forced:
+            if forced & (forced - 1):
+                # two threats at once, only one can be blocked
+                return -(empty - 1)
+            possible = forced
+        # never fill the cell right below a winning cell of the opponent
+        possible &= ~(opponent_wins >> 1)
+        if not possible:
+            return -(empty - 1)
+
+        # we cannot win before our next move, the opponent not before theirs
+        upper = empty - 2
+        if beta > upper:
+            beta = upper
+            if alpha >= beta:
+                return beta
+        lower = -(empty - 3) if empty > 3 else -1
+        if alpha < lower:
+            alpha = lower
+            if alpha >= beta:
+                return alpha
+
+        key = me + occupied
+        entry = self.cache.get(key)
+        if entry is not None:
+            flag, value = entry
+            if flag == _EXACT:
+                return value
+            if flag == _LOWER:
+                if value >= beta:
+                    return value
+                if value > alpha:
+                    alpha = value
+            elif value <= alpha:
+                return value
+            elif value < beta:
+                beta = value
+
+        alpha_orig = alpha
+        best = -WIDTH * HEIGHT
+        for bit in self._ordered_moves(me, occupied, possible):
+            value = -self._negamax(opponent, occupied | bit, empty - 1, -beta, -alpha)
+            if value > best:
+                best = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if best <= alpha_orig:
+            self.cache[key] = (_UPPER, best)
+        elif best >= beta:
+            self.cache[key] = (_LOWER, best)
+        else:
+            self.cache[key] = (_EXACT, best)
+        return best
+
+    @staticmethod
+    def _ordered_moves(me, occupied, possible):
+        # moves that leave the most own winning cells first, center columns break ties
+        if not possible & (possible - 1):
+            return [possible]
+        scored = []
+        for order, col in enumerate(CENTER_ORDER):
+            bit = possible & COLUMN_MASKS[col]
+            if bit:
+                threats = (winning_cells(me | bit, occupied | bit)).bit_count()
+                scored.append((-threats, order, bit))
+        scored.sort()
+        return [bit for _, _, bit in scored]
+
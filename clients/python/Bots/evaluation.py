@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+
+from Bots.bitboard import BOTTOM_MASK, HEIGHT, WIDTH, cross_mask, playable_cells
+
+# rows 1, 3, 5 and rows 2, 4, 6 counted from the bottom. when the board fills up the player
+# who moves with an even number of empty cells gets the odd rows (zugzwang), the other one the
+# even rows, so a threat on a row of the own parity is worth more.
+ODD_ROWS = sum(BOTTOM_MASK << row for row in range(0, HEIGHT, 2))
+EVEN_ROWS = sum(BOTTOM_MASK << row for row in range(1, HEIGHT, 2))
+
+
+@dataclass(frozen=True)
+class EvalWeights:
+    # points per feature, every feature counts for coin_id minus the same for the opponent
+    win: int = 50
+    double_threat: int = 10
+    threat: int = 2
+    parity: int = 4
+    bomb: int = 20
+
+
+DEFAULT_WEIGHTS = EvalWeights()
+
+
+def threat_features(position, coin_id, playable):
+    # read from the threat map of the position, nothing is played or scanned:
+    #   wins      threat cells that can be played right now
+    #   doubles   two playable wins at once, or a playable threat with another threat on top
+    #   latent    threat cells that are not playable yet
+    open_cells = position.threats[coin_id] & ~position.occupied
+    wins = open_cells & playable
+    doubles = (open_cells & (open_cells >> 1) & playable).bit_count()
+    if wins & (wins - 1):
+        doubles += 1
+    return wins.bit_count(), doubles, open_cells & ~playable
+
+
+def evaluate(position, coin_id, current_player, bombs=None, current_round=0, bomb_horizon=0,
+             weights=DEFAULT_WEIGHTS):
+    # static score from the view of coin_id, current_player is to move
+    opponent_id = 2 if coin_id == 1 else 1
+    playable = playable_cells(position.occupied)
+    my_wins, my_doubles, my_latent = threat_features(position, coin_id, playable)
+    opponent_wins, opponent_doubles, opponent_latent = threat_features(position, opponent_id, playable)
+
+    empty = WIDTH * HEIGHT - position.count()
+    # the player to move with an even number of empty cells plays like the starting player
+    mover_rows = ODD_ROWS if empty % 2 == 0 else EVEN_ROWS
+    my_rows = mover_rows if current_player == coin_id else mover_rows ^ (ODD_ROWS | EVEN_ROWS)
+    my_parity = (my_latent & my_rows).bit_count()
+    opponent_parity = (opponent_latent & ~my_rows).bit_count()
+
+    score = (weights.win * (my_wins - opponent_wins)
+             + weights.double_threat * (my_doubles - opponent_doubles)
+             + weights.threat * (my_latent.bit_count() - opponent_latent.bit_count())
+             + weights.parity * (my_parity - opponent_parity))
+
+    if bombs:
+        soonest = min(b.get("explode_in_round", 1000) - current_round for b in bombs)
+        # only project the explosion if it will happen within the search horizon
+        if soonest <= bomb_horizon:
+            score += weights.bomb * bomb_win_difference(position, coin_id, bombs)
+    return score
+
+
+def bomb_win_difference(position, coin_id, bombs):
+    # playable wins of coin_id minus those of the opponent once every bomb went off
+    blast = 0
+    for bomb in bombs:
+        row = bomb.get("row")
+        col = bomb.get("col")
+        if row is not None and col is not None:
+            blast |= cross_mask(row, col)
+    if not blast:
+        return 0
+    saved = position.save()
+    try:
+        position.detonate(blast)
+        playable = playable_cells(position.occupied)
+        return ((position.threats[coin_id] & playable).bit_count()
+                - (position.threats[2 if coin_id == 1 else 1] & playable).bit_count())
+    finally:
+        position.restore(saved)
@@ -0,0 +1,136 @@
+import struct
+import time
+from dataclasses import dataclass
+from typing import Iterator, Tuple
+
+from Bots.bitboard import Position
+from Bots.data import PlayState
+
+# append only record of every state bot.py answered. the file starts with a header, then
+# records of one kind byte and a fixed part:
+#   session   the start of a bot.py run: unix time and the bot name
+#   move      the position as bitboards (coin 1, coin 2, bomb cells), game of the session,
+#             round, coin, the column sent, flags, time to the answer in 0.1 ms and the
+#             pending bombs (row, col, explode_in_round) behind it
+# a log cut off in the middle of a record (a killed client) reads up to the last full one.
+MAGIC = b"C4GL"
+VERSION = 1
+_HEADER = struct.Struct("<4sH")
+_KIND = struct.Struct("<B")
+_SESSION = struct.Struct("<dB")
+_MOVE = struct.Struct("<QQQHBBbBHB")
+_BOMB = struct.Struct("<BBB")
+SESSION = 1
+MOVE = 2
+# move flags: the search missed the deadline and the best move so far or a safe column was sent
+LATE = 1
+# the buffer goes to the file once it is this big, when a game ends and on close
+FLUSH_BYTES = 64 * 1024
+MAX_THINK = 0xFFFF
+
+
+@dataclass(frozen=True)
+class LogRecord:
+    session: int
+    bot: str
+    game: int
+    round: int
+    coin_id: int
+    move: int
+    flags: int
+    think_ms: float
+    stones_one: int
+    stones_two: int
+    bomb: int
+    bombs: Tuple[dict, ...]
+
+    @property
+    def late(self):
+        return bool(self.flags & LATE)
+
+    def position(self) -> Position:
+        return Position([0, self.stones_one, self.stones_two], self.bomb)
+
+    def state(self) -> PlayState:
+        return PlayState(self.bot, self.coin_id, self.round, self.bombs, self.position())
+
+
+class GameLog:
+    # record() only packs the move into a buffer, the answer is sent already and nothing
+    # waits for the disk
+    def __init__(self, path, bot_name, flush_bytes=FLUSH_BYTES):
+        self.file = open(path, "ab")
+        self.flush_bytes = flush_bytes
+        self.buffer = bytearray()
+        self.game = None
+        if self.file.tell() == 0:
+            self.buffer += _HEADER.pack(MAGIC, VERSION)
+        name = bot_name.encode("utf-8")[:255]
+        self.buffer += _KIND.pack(SESSION) + _SESSION.pack(time.time(), len(name)) + name
+
+    def record(self, game, state: PlayState, move, think_ms, flags=0):
+        if game != self.game and self.game is not None:
+            # the last game is complete, get it on disk before the new one starts
+            self.flush()
+        self.game = game
+        position = state.position
+        self.buffer += _KIND.pack(MOVE)
+        self.buffer += _MOVE.pack(position.stones[1], position.stones[2], position.bomb, game & 0xFFFF, state.round,
+                                  state.coin_id, move if isinstance(move, int) and -128 <= move < 128 else -1, flags,
+                                  min(MAX_THINK, round(think_ms * 10)), len(state.bombs))
+        for bomb in state.bombs:
+            self.buffer += _BOMB.pack(bomb["row"], bomb["col"], bomb["explode_in_round"])
+        if len(self.buffer) >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write(self.buffer)
+            self.file.flush()
+            self.buffer.clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_log(path) -> Iterator[LogRecord]:
+    # streams the records of a log file one by one
+    with open(path, "rb") as file:
+        header = file.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        magic, version = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a game log of version {VERSION}")
+        session = 0
+        bot = ""
+        while True:
+            kind = file.read(_KIND.size)
+            if not kind:
+                return
+            if kind[0] == SESSION:
+                data = file.read(_SESSION.size)
+                if len(data) < _SESSION.size:
+                    return
+                _, length = _SESSION.unpack(data)
+                name = file.read(length)
+                if len(name) < length:
+                    return
+                session += 1
+                bot = name.decode("utf-8", "replace")
+            elif kind[0] == MOVE:
+                data = file.read(_MOVE.size)
+                if len(data) < _MOVE.size:
+                    return
+                one, two, bomb, game, current_round, coin_id, move, flags, think, bomb_count = _MOVE.unpack(data)
+                data = file.read(bomb_count * _BOMB.size)
+                if len(data) < bomb_count * _BOMB.size:
+                    return
+                bombs = tuple({"row": row, "col": col, "explode_in_round": explode_in_round}
+                              for row, col, explode_in_round in _BOMB.iter_unpack(data))
+                yield LogRecord(session, bot, game, current_round, coin_id, move, flags, think / 10, one, two, bomb,
+                                bombs)
+            else:
+                raise ValueError(f"{path}: unknown record kind {kind[0]} at byte {file.tell() - 1}")
+
@@ -0,0 +1,23 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# the contest rules allow one thread besides the main thread. every background job of a bot
+# runs on this executor, it never starts a second worker.
+_executor = None
+_lock = threading.Lock()
+
+
+def helper_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="helper")
+        return _executor
+
+
+def shutdown_helper():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -0,0 +1,89 @@
+from Bots.bitboard import CENTER_ORDER, COLUMN_MASKS, HEIGHT, WIDTH
+from Bots.transposition import NO_MOVE
+
+# a search never gets deeper than the board has cells
+MAX_PLY = WIDTH * HEIGHT + 1
+KILLERS_PER_PLY = 2
+
+# sort keys of the move classes, each one above everything the classes below can reach
+TT_MOVE_KEY = 1 << 62
+WIN_KEY = 1 << 61
+BLOCK_KEY = 1 << 60
+KILLER_KEY = 1 << 59
+# history counts are scaled by this, so the center rank only breaks ties
+HISTORY_SCALE = WIDTH
+CENTER_RANK = tuple(WIDTH - 1 - CENTER_ORDER.index(col) for col in range(WIDTH))
+
+
+class MoveOrderer:
+    # order in which score() tries the moves of a node:
+    #   1. the move the transposition table (or the last iteration) found best
+    #   2. moves that win right away, then moves that block a win of the opponent
+    #   3. the killer moves of this ply, moves that caused a cutoff in a sibling node
+    #   4. the rest by history score (cutoffs per player and column, weighted by depth),
+    #      the center columns break ties
+    # the history survives from move to move and is halved at the start of every search.
+    def __init__(self):
+        self.killers = [[NO_MOVE] * KILLERS_PER_PLY for _ in range(MAX_PLY)]
+        self.history = [[0] * WIDTH for _ in range(3)]
+        self.reset_stats()
+
+    def new_search(self):
+        for killers in self.killers:
+            killers[:] = [NO_MOVE] * KILLERS_PER_PLY
+        for history in self.history:
+            history[:] = [value >> 1 for value in history]
+
+    def clear(self):
+        self.new_search()
+        self.history = [[0] * WIDTH for _ in range(3)]
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def order(self, position, moves, player, ply, tt_move=NO_MOVE):
+        if len(moves) < 2:
+            return moves
+        wins = position.winning_moves(player)
+        blocks = position.winning_moves(2 if player == 1 else 1)
+        killers = self.killers[ply]
+        history = self.history[player]
+        keys = {}
+        for col in moves:
+            if col == tt_move:
+                keys[col] = TT_MOVE_KEY
+            elif wins & COLUMN_MASKS[col]:
+                keys[col] = WIN_KEY
+            elif blocks & COLUMN_MASKS[col]:
+                keys[col] = BLOCK_KEY
+            elif col in killers:
+                # the newer killer first
+                keys[col] = KILLER_KEY - killers.index(col)
+            else:
+                keys[col] = history[col] * HISTORY_SCALE + CENTER_RANK[col]
+        return sorted(moves, key=keys.__getitem__, reverse=True)
+
+    def record(self, player, ply, depth, move, index, cutoff):
+        # called once per searched node with the move that decided it and its place in the order
+        self.nodes += 1
+        if not cutoff:
+            return
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[player][move] += depth * depth
+
+    def stats(self):
+        return {
+            "interior_nodes": self.nodes,
+            "cutoffs": self.cutoffs,
+            "cutoff_rate": round(self.cutoffs / self.nodes, 3) if self.nodes else 0.0,
+            "first_move_cutoff_rate": round(self.first_move_cutoffs / self.cutoffs, 3) if self.cutoffs else 0.0,
+        }
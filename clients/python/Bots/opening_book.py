@@ -0,0 +1,110 @@
+import mmap
+import os
+import struct
+
+from Bots.bitboard import SIDE_KEYS, WIDTH, mirror, zobrist_hash
+
+# the first moves of a game, searched offline by make_book.py. a bomb can drop from turn 5
+# on, positions with a bomb are never in the book.
+BOOK_PATH = os.path.join(os.path.dirname(__file__), "opening_book.bin")
+MAX_BOOK_ROUND = 6
+
+# file layout: header, then a power of two number of slots with linear probing.
+# a slot is the key (0 = empty), the book move, the depth of the search and its score.
+MAGIC = b"C4OB"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHI")
+_SLOT = struct.Struct("<Qbbh")
+_EMPTY = 0
+
+
+def book_key(position, coin_id):
+    # the stones of the player to move always count as coin 1, a position and its mirror
+    # image share one entry. returns the key and whether the entry is stored mirrored.
+    # the side key keeps the empty board away from key 0, the mark of an empty slot.
+    own = position.stones[coin_id]
+    other = position.stones[3 - coin_id]
+    key = zobrist_hash(own, other, position.bomb) ^ SIDE_KEYS[1]
+    mirrored_key = zobrist_hash(mirror(own), mirror(other), mirror(position.bomb)) ^ SIDE_KEYS[1]
+    if mirrored_key < key:
+        return mirrored_key, True
+    return key, False
+
+
+def write_book(path, entries):
+    # entries maps a book_key to (move, depth, score) in the orientation of that key
+    slots = 16
+    while slots < 2 * len(entries):
+        slots *= 2
+    table = bytearray(_HEADER.size + slots * _SLOT.size)
+    _HEADER.pack_into(table, 0, MAGIC, VERSION, _SLOT.size, slots)
+    for key, (move, depth, score) in entries.items():
+        index = key & (slots - 1)
+        while _SLOT.unpack_from(table, _HEADER.size + index * _SLOT.size)[0] != _EMPTY:
+            index = (index + 1) & (slots - 1)
+        _SLOT.pack_into(table, _HEADER.size + index * _SLOT.size, key, move, depth, score)
+    with open(path, "wb") as file:
+        file.write(table)
+    return len(table)
+
+
+class OpeningBook:
+    # read only view of a book file, a missing or broken file gives an empty book
+    def __init__(self, path=BOOK_PATH):
+        self.data = None
+        self.slots = 0
+        try:
+            with open(path, "rb") as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        if len(data) < _HEADER.size:
+            data.close()
+            return
+        magic, version, slot_size, slots = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION or slot_size != _SLOT.size \
+                or slots & (slots - 1) or len(data) != _HEADER.size + slots * _SLOT.size:
+            data.close()
+            return
+        self.data = data
+        self.slots = slots
+
+    def __len__(self):
+        if self.data is None:
+            return 0
+        return sum(1 for index in range(self.slots)
+                   if _SLOT.unpack_from(self.data, _HEADER.size + index * _SLOT.size)[0] != _EMPTY)
+
+    def probe(self, key):
+        # (move, depth, score) or None
+        if self.data is None:
+            return None
+        mask = self.slots - 1
+        index = key & mask
+        while True:
+            slot_key, move, depth, score = _SLOT.unpack_from(self.data, _HEADER.size + index * _SLOT.size)
+            if slot_key == key:
+                return move, depth, score
+            if slot_key == _EMPTY:
+                return None
+            index = (index + 1) & mask
+
+    def lookup(self, position, coin_id, current_round):
+        # book move of coin_id in position or None
+        if self.data is None or current_round > MAX_BOOK_ROUND or position.bomb:
+            return None
+        key, mirrored = book_key(position, coin_id)
+        entry = self.probe(key)
+        if entry is None:
+            return None
+        move, depth, score = entry
+        if mirrored:
+            move = WIDTH - 1 - move
+        if not position.can_play(move):
+            return None
+        return move, depth, score
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.data = None
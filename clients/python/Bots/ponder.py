@@ -0,0 +1,81 @@
+import sys
+import threading
+from time import perf_counter
+
+from Bots.helper_thread import helper_executor
+from Bots.time_manager import SearchTimeout
+
+# while the helper thread searches, the main thread has to get the interpreter back quickly
+# once the next message arrives (the default switch interval is 5 ms)
+PONDER_SWITCH_INTERVAL = 0.001
+# a ponder search that is never stopped (game over, server gone) ends on its own
+MAX_PONDER_SECONDS = 30
+
+
+class PonderClock:
+    # stands in for the TimeManager of a normal search, check() aborts once stop() was called
+    def __init__(self):
+        self._stopped = threading.Event()
+        self._give_up_at = perf_counter() + MAX_PONDER_SECONDS
+
+    def stop(self):
+        self._stopped.set()
+
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def check(self):
+        if self._stopped.is_set() or perf_counter() >= self._give_up_at:
+            raise SearchTimeout()
+
+
+class Ponderer:
+    # searches the opponent's likely replies on the helper thread during the opponent's turn.
+    # the job gets a PonderClock and reports what it found through record().
+    def __init__(self):
+        self.future = None
+        self.clock = None
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+        self._switch_interval = None
+
+    def pondering(self):
+        return self.future is not None
+
+    def start(self, job, *args):
+        self.stop()
+        self.results = {}
+        self.clock = PonderClock()
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(PONDER_SWITCH_INTERVAL)
+        self.future = helper_executor().submit(self._run, self.clock, job, args)
+
+    @staticmethod
+    def _run(clock, job, args):
+        try:
+            job(clock, *args)
+        except SearchTimeout:
+            pass
+
+    def stop(self):
+        # blocks until the helper thread left the search, so the caller owns all shared
+        # state (transposition table, position) afterwards
+        if self.future is None:
+            return
+        self.clock.stop()
+        future = self.future
+        self.future = None
+        sys.setswitchinterval(self._switch_interval)
+        future.result()
+
+    def record(self, key, depth, best_score, best_moves):
+        self.results[key] = (depth, best_score, best_moves)
+
+    def lookup(self, key):
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
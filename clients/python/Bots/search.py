@@ -0,0 +1,336 @@
+from math import ceil, floor
+
+from Bots.bitboard import cross_mask
+from Bots.evaluation import DEFAULT_WEIGHTS, evaluate
+from Bots.move_ordering import MoveOrderer
+from Bots.simulator import BOMB_WINDOWS, BOOM_IN
+from Bots.transposition import EXACT, LOWER, NO_MOVE, UPPER, search_key
+from Bots.vector_eval import available as batch_available, evaluate_batch
+
+# the heuristic projects a bomb explosion that happens within this many rounds
+BOMB_HORIZON = 3
+# nodes between two looks at the clock
+TIME_CHECK_INTERVAL = 64
+# a possible bomb drop is only searched with at least this much depth left, and the branches
+# with a bomb SPAWN_REDUCTION plies shallower than the one without
+SPAWN_MIN_DEPTH = 3
+SPAWN_REDUCTION = 2
+# chance nodes on one path, later drops below one are not searched
+SPAWN_NODES_PER_PATH = 1
+
+WIN_SCORE = 500
+INFINITY = 10_000
+
+
+def count_wins(position, coin_id):
+    return position.winning_moves(coin_id).bit_count()
+
+
+def is_double_threat_move(position, coin_id, xCol):
+    # after xCol some reply of the opponent still leaves us two winning columns
+    opponent_id = 2 if coin_id == 1 else 1
+    position.play(xCol, coin_id)
+    try:
+        for opp_xCol in position.legal_columns():
+            position.play(opp_xCol, opponent_id)
+            my_wins = position.winning_moves(coin_id)
+            position.undo(opp_xCol, opponent_id)
+            # more than one bit set -> at least two winning columns
+            if my_wins & (my_wins - 1):
+                return True
+    finally:
+        position.undo(xCol, coin_id)
+    return False
+
+
+def spawn_odds(current_round, bombs):
+    # {turn: outcomes} for every later turn at which a bomb can still drop. game.gd
+    # picks the drop turn of each window uniformly, so if none dropped before, one drops at
+    # that turn with probability 1 / outcomes. a drop long enough ago that its bomb exploded
+    # already cannot be seen in the state, it counts as one of the outcomes.
+    odds = {}
+    for low, high in BOMB_WINDOWS:
+        if high <= current_round:
+            continue
+        if any(low <= bomb.get("explode_in_round", 0) - BOOM_IN <= high for bomb in bombs or ()):
+            # the bomb of this window is still on the board
+            continue
+        exploded = max(0, min(high, current_round - BOOM_IN) - low + 1)
+        for turn in range(max(low, current_round + 1), high + 1):
+            odds[turn] = exploded + high - turn + 1
+    return odds
+
+
+def explode_bombs(position, bombs):
+    # copy of position after all bombs went off
+    if not bombs:
+        return position
+
+    exploded = position.copy()
+    blast = 0
+    for bomb in bombs:
+        row = bomb.get("row")
+        col = bomb.get("col")
+        if row is None or col is None:
+            continue
+        blast |= cross_mask(row, col)
+    if blast:
+        exploded.detonate(blast)
+    return exploded
+
+
+class AlphaBetaSearch:
+    # alpha-beta minimax on one position, scores are always from the view of coin_id.
+    # clock.check() raises SearchTimeout to abort, every move is taken back on the way out.
+    # batch_leaves scores all children of a depth 1 node in one numpy call (vector_eval.py),
+    # that only pays off for far wider frontiers than connect four has, so it is off by default.
+    # the orderer keeps killers and history, pass the bot's one to keep them between moves.
+    # between two moves the tree does what game.gd does: pending bombs explode in their round
+    # and a new bomb may drop in a spawn window (a chance node over the free columns).
+    def __init__(self, position, coin_id, bombs, table, clock, weights=DEFAULT_WEIGHTS, batch_leaves=False,
+                 orderer=None):
+        self.position = position
+        self.coin_id = coin_id
+        self.opponent_id = 2 if coin_id == 1 else 1
+        self.bombs = bombs
+        self.explode_round = min((b.get("explode_in_round", 0) for b in bombs), default=0) if bombs else 0
+        self.table = table
+        self.clock = clock
+        self.weights = weights
+        self.batch_leaves = batch_leaves and batch_available()
+        self.orderer = orderer if orderer is not None else MoveOrderer()
+        self.root_depth = 0
+        self.spawn_round = None
+        self.spawn_odds = {}
+        self.chance_nodes = 0
+        self.nodes = 0
+
+    def heuristic(self, current_player, current_round):
+        # static evaluation from the threat maps, see evaluation.py
+        return evaluate(self.position, self.coin_id, current_player, self.bombs, current_round, BOMB_HORIZON,
+                        self.weights)
+
+    def score(self, current_player, current_depth, alpha, beta, current_round):
+        self.nodes += 1
+        if not self.nodes % TIME_CHECK_INTERVAL:
+            self.clock.check()
+        position = self.position
+        table = self.table
+        moves = position.legal_columns()
+        key = search_key(position.hash, current_player, current_round, self.explode_round, self.coin_id)
+        if not moves:
+            # no draws in game.gd: a player who finds the board full on their turn loses, like
+            # in endgame.py. the result holds at every depth.
+            value = -WIN_SCORE if current_player == self.coin_id else WIN_SCORE
+            table.store(key, current_depth, EXACT, value)
+            return value
+
+        entry = table.probe(key)
+        tt_move = NO_MOVE
+        if entry is not None:
+            entry_depth, flag, value, tt_move = entry
+            if entry_depth >= current_depth:
+                if flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha):
+                    table.cutoffs += 1
+                    return value
+
+        if current_depth == 0:
+            # leaf evaluations are cached too
+            value = self.heuristic(current_player, current_round)
+            table.store(key, 0, EXACT, value)
+            return value
+
+        ply = self.root_depth - current_depth
+        moves = self.orderer.order(position, moves, current_player, ply, tt_move)
+
+        leaf_values = None
+        if current_depth == 1 and self.batch_leaves and current_round + 1 != self.explode_round:
+            leaf_values = self.batch_leaf_values(moves, current_player, current_round + 1)
+
+        maximizing = current_player == self.coin_id
+        best_val = -INFINITY if maximizing else INFINITY
+        best_move = moves[0]
+        best_index = 0
+        alpha_orig = alpha
+        beta_orig = beta
+        next_player = self.opponent_id if maximizing else self.coin_id
+
+        for index, xMove in enumerate(moves):
+            if position.is_winning_move(xMove, current_player):
+                value = WIN_SCORE if maximizing else -WIN_SCORE
+            elif leaf_values is not None:
+                value = leaf_values[xMove]
+            else:
+                position.play(xMove, current_player)
+                try:
+                    value = self.after_move(next_player, current_depth - 1, alpha, beta, current_round + 1)
+                finally:
+                    position.undo(xMove, current_player)
+
+            if maximizing:
+                if value > best_val:
+                    best_val = value
+                    best_move = xMove
+                    best_index = index
+                if best_val > alpha:
+                    alpha = best_val
+            else:
+                if value < best_val:
+                    best_val = value
+                    best_move = xMove
+                    best_index = index
+                if best_val < beta:
+                    beta = best_val
+
+            if alpha >= beta:
+                break
+
+        self.orderer.record(current_player, ply, current_depth, best_move, best_index, alpha >= beta)
+
+        if best_val <= alpha_orig:
+            flag = UPPER
+        elif best_val >= beta_orig:
+            flag = LOWER
+        else:
+            flag = EXACT
+        table.store(key, current_depth, flag, best_val, best_move)
+        return best_val
+
+    def after_move(self, next_player, depth, alpha, beta, next_round):
+        # score of the position after a move, once game.gd handled the turn change
+        if next_round == self.explode_round:
+            return self.explosion(next_player, depth, alpha, beta, next_round)
+        outcomes = self.spawn_odds.get(next_round)
+        if (outcomes is not None and depth >= SPAWN_MIN_DEPTH and not self.position.bomb
+                and self.chance_nodes < SPAWN_NODES_PER_PATH):
+            return self.spawn(next_player, depth, alpha, beta, next_round, outcomes)
+        return self.score(next_player, depth, alpha, beta, next_round)
+
+    def explosion(self, next_player, depth, alpha, beta, next_round):
+        # the bombs of next_round go off like in board.gd, then the game goes on or is over
+        position = self.position
+        bombs = self.bombs
+        explode_round = self.explode_round
+        blast = 0
+        remaining = []
+        for bomb in bombs:
+            if bomb.get("explode_in_round") != next_round:
+                remaining.append(bomb)
+            elif bomb.get("row") is not None and bomb.get("col") is not None:
+                blast |= cross_mask(bomb["row"], bomb["col"])
+        saved = position.save()
+        position.detonate(blast)
+        self.bombs = remaining
+        self.explode_round = min((b.get("explode_in_round", 0) for b in remaining), default=0)
+        try:
+            # a full scan, both players can win by the same explosion and both get a point
+            winners = position.winners()
+            if len(winners) == 2:
+                return 0
+            if winners:
+                return WIN_SCORE if winners[0] == self.coin_id else -WIN_SCORE
+            return self.score(next_player, depth, alpha, beta, next_round)
+        finally:
+            position.restore(saved)
+            self.bombs = bombs
+            self.explode_round = explode_round
+
+    def spawn(self, next_player, depth, alpha, beta, next_round, outcomes):
+        # chance node: a bomb drops now with probability 1 / outcomes, into every free column
+        # with the same chance (game.gd _spawn_bomb). the value is the expected score.
+        # star1 pruning: scores lie within +-WIN_SCORE, so once the branches left cannot bring
+        # the expected score back into (alpha, beta) the node is cut. every branch gets the
+        # window it needs for that and the branch without a bomb goes first.
+        columns = self.position.legal_columns()
+        drop = 1 / outcomes
+        branches = [(drop / len(columns), col) for col in columns]
+        if drop < 1:
+            branches.insert(0, (1 - drop, None))
+        expected = 0.0
+        left = 1.0
+        self.chance_nodes += 1
+        try:
+            for probability, col in branches:
+                left -= probability
+                child_alpha = max(-WIN_SCORE, (alpha - expected - left * WIN_SCORE) / probability)
+                child_beta = min(WIN_SCORE, (beta - expected + left * WIN_SCORE) / probability)
+                if col is None:
+                    value = self.score(next_player, depth, child_alpha, child_beta, next_round)
+                else:
+                    value = self.spawned(col, next_player, depth - SPAWN_REDUCTION, child_alpha, child_beta,
+                                         next_round)
+                expected += probability * max(-WIN_SCORE, min(WIN_SCORE, value))
+                if expected + left * WIN_SCORE <= alpha:
+                    return floor(expected + left * WIN_SCORE)
+                if expected - left * WIN_SCORE >= beta:
+                    return ceil(expected - left * WIN_SCORE)
+            return round(expected)
+        finally:
+            self.chance_nodes -= 1
+
+    def spawned(self, col, next_player, depth, alpha, beta, next_round):
+        # score after a bomb dropped into col, it explodes BOOM_IN turns later
+        position = self.position
+        bombs = self.bombs
+        explode_round = self.explode_round
+        position.drop_bomb(col)
+        self.bombs = [*bombs, {"row": position.heights[col] - 1, "col": col, "explode_in_round": next_round + BOOM_IN}]
+        self.explode_round = min(b.get("explode_in_round", 0) for b in self.bombs)
+        try:
+            return self.score(next_player, depth, alpha, beta, next_round)
+        finally:
+            position.lift_bomb(col)
+            self.bombs = bombs
+            self.explode_round = explode_round
+
+    def batch_leaf_values(self, moves, current_player, leaf_round):
+        # static scores of the positions after every move that does not win at once, keyed by
+        # column. they are stored like the leaves of score() would store them.
+        position = self.position
+        table = self.table
+        leaf_player = self.opponent_id if current_player == self.coin_id else self.coin_id
+        columns = []
+        leaves = []
+        keys = []
+        for xMove in moves:
+            if position.is_winning_move(xMove, current_player):
+                continue
+            position.play(xMove, current_player)
+            leaves.append(position.copy())
+            keys.append(search_key(position.hash, leaf_player, leaf_round, self.explode_round, self.coin_id))
+            position.undo(xMove, current_player)
+            columns.append(xMove)
+        self.nodes += len(leaves)
+        values = evaluate_batch(leaves, self.coin_id, leaf_player, self.bombs, leaf_round, BOMB_HORIZON, self.weights)
+        for key, value in zip(keys, values):
+            table.store(key, 0, EXACT, value)
+        return dict(zip(columns, values))
+
+    def search_root(self, root_moves, root_depth, current_round):
+        # coin_id is to move, returns the best score and every move that reaches it
+        position = self.position
+        coin_id = self.coin_id
+        self.root_depth = root_depth
+        if self.spawn_round != current_round:
+            self.spawn_round = current_round
+            self.spawn_odds = spawn_odds(current_round, self.bombs)
+        best_moves = []
+        best_score = -INFINITY
+        for xCol in root_moves:
+            if position.is_winning_move(xCol, coin_id):
+                move_score = 2 * WIN_SCORE
+            else:
+                position.play(xCol, coin_id)
+                try:
+                    # moves scoring below the best so far only need to be refuted
+                    move_score = self.after_move(self.opponent_id, root_depth - 1, best_score - 1, INFINITY,
+                                                 current_round + 1)
+                finally:
+                    position.undo(xCol, coin_id)
+
+            if move_score > best_score:
+                best_score = move_score
+                best_moves = [xCol]
+            elif move_score == best_score:
+                best_moves.append(xCol)
+        return best_score, best_moves
@@ -0,0 +1,111 @@
+from Bots.bitboard import CENTER_ORDER, COLUMN_MASKS, WIDTH, cross_mask, playable_cells
+from Bots.bot_ai import BotAI
+from Bots.data import PlayState
+from Bots.simulator import BOOM_IN
+
+
+def turn_change(position, turn, pending, new_bombs):
+    # game.gd _next for turn on position: a bomb of new_bombs drops, or the pending bombs due
+    # go off. returns the bombs still pending and the ones that exploded.
+    dropped = [bomb for bomb in new_bombs if bomb["explode_in_round"] - BOOM_IN == turn]
+    if dropped:
+        for bomb in dropped:
+            if position.heights[bomb["col"]] != bomb["row"]:
+                return None
+            position.drop_bomb(bomb["col"])
+        return pending + dropped, []
+    exploding = [bomb for bomb in pending if bomb["explode_in_round"] <= turn]
+    if not exploding:
+        return pending, []
+    blast = 0
+    for bomb in exploding:
+        blast |= cross_mask(bomb["row"], bomb["col"])
+    position.detonate(blast)
+    return [bomb for bomb in pending if bomb not in exploding], exploding
+
+
+def replay(previous: PlayState, move, opponent_move, state: PlayState):
+    # the position after move, the turn change, opponent_move and the next turn change,
+    # bombs that drop on the way are taken from state. returns (position, exploded bombs)
+    # or None if the moves cannot be played.
+    position = previous.position.copy()
+    if not isinstance(move, int) or not 0 <= move < WIDTH or not position.can_play(move):
+        return None
+    position.play(move, previous.coin_id)
+    new_bombs = [bomb for bomb in state.bombs if bomb not in previous.bombs]
+    changed = turn_change(position, previous.round + 1, list(previous.bombs), new_bombs)
+    if changed is None or not position.can_play(opponent_move):
+        return None
+    pending, exploded = changed
+    position.play(opponent_move, 2 if previous.coin_id == 1 else 1)
+    changed = turn_change(position, previous.round + 2, pending, new_bombs)
+    if changed is None:
+        return None
+    return position, exploded + changed[1]
+
+
+def infer_opponent_move(previous: PlayState, move, state: PlayState):
+    # the column the opponent played between two of our states and the bombs that exploded
+    # meanwhile, (None, []) if no column explains the new board. if the blast took the stone
+    # away again several columns explain it, the first one is taken.
+    for opponent_move in range(WIDTH):
+        replayed = replay(previous, move, opponent_move, state)
+        if replayed is not None and replayed[0] == state.position:
+            return opponent_move, replayed[1]
+    return None, []
+
+
+def safe_column(position, coin_id):
+    # a legal column without any search for when there is no time left: the win, else the
+    # block, else the most central column that does not let the opponent win on top of it
+    legal = position.legal_columns()
+    if not legal:
+        return CENTER_ORDER[0]
+    opponent_id = 2 if coin_id == 1 else 1
+    for wins in (position.winning_moves(coin_id), position.winning_moves(opponent_id)):
+        if wins:
+            return next(col for col in legal if wins & COLUMN_MASKS[col])
+    below_threats = (position.winning_cells(opponent_id) >> 1) & playable_cells(position.occupied)
+    for col in CENTER_ORDER:
+        if col in legal and not below_threats & COLUMN_MASKS[col]:
+            return col
+    return next(col for col in CENTER_ORDER if col in legal)
+
+
+class GameSession:
+    # sits between bot.py and the bot and follows the match from state to state. every state
+    # is compared with the one before: if our move, the turn changes and one column of the
+    # opponent do not lead to it, it cannot follow the last one and starts a new game of the
+    # match. the bot keeps its tables (transposition table, history, ponder results) from move
+    # to move and only clears them in on_new_game().
+    def __init__(self, bot: BotAI):
+        self.bot = bot
+        self.games = 0
+        self.previous = None
+        self.last_move = None
+
+    def observe(self, state: PlayState):
+        # before the bot sees state
+        if self.is_new_game(state):
+            self.start_game()
+
+    def record(self, state: PlayState, move):
+        # the column that was sent for state, not necessarily the one the bot chose
+        self.previous = state
+        self.last_move = move
+
+    def is_new_game(self, state: PlayState):
+        # within a game our states come every second round with the same coin. a game that
+        # ended after a round or two (illegal move, timeout) lets the next one start at a
+        # higher round, only the board shows that it is new.
+        previous = self.previous
+        if previous is None or state.round != previous.round + 2 or state.coin_id != previous.coin_id:
+            return True
+        opponent_move, _ = infer_opponent_move(previous, self.last_move, state)
+        return opponent_move is None
+
+    def start_game(self):
+        self.games += 1
+        self.previous = None
+        self.last_move = None
+        self.bot.on_new_game()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Callable, List, Optional
+
+from Bots.bitboard import WIDTH, Position
+from Bots.bot_ai import BotAI
+from Bots.data import PlayState
+from Bots.time_manager import MOVE_TIMEOUT_MS
+
+# headless copy of the rules in game/scenes/game/game.gd and board.gd
+
+# a bomb drops at a random turn of each window (game.gd _game_reset)
+BOMB_WINDOWS = ((5, 10), (15, 20), (25, 30))
+# bomb.gd boom_in, the bomb explodes right before the move of turn drop + BOOM_IN
+BOOM_IN = 4
+GAMES_PER_MATCH = 11
+
+WIN = "four"
+EXPLOSION = "explosion"
+ILLEGAL = "illegal"
+TIMEOUT = "timeout"
+
+
+@dataclass
+class Bomb:
+    row: int
+    col: int
+    boom_in_round: int
+
+
+@dataclass
+class GameResult:
+    winners: List[int]
+    reason: str
+    turns: int
+    moves: List[int] = field(default_factory=list)
+
+
+class Game:
+    def __init__(self, first_player=1, rng: Optional[random.Random] = None, bomb_drop_turns=None):
+        self.rng = rng or random.Random()
+        self.position = Position()
+        self.current_turn = 1
+        self.bomb_drop_turns = bomb_drop_turns or [self.rng.randint(low, high) for low, high in BOMB_WINDOWS]
+        self.bomb: Optional[Bomb] = None
+        self.to_move = first_player
+        self.result: Optional[GameResult] = None
+        self.moves: List[int] = []
+
+    def over(self):
+        return self.result is not None
+
+    def bombs_data(self):
+        # game.gd _get_all_bomb_data only lists bombs that did not explode yet
+        if self.bomb is None or self.bomb.boom_in_round <= self.current_turn:
+            return []
+        return [{"row": self.bomb.row, "col": self.bomb.col, "explode_in_round": self.bomb.boom_in_round}]
+
+    def play_state(self, bot_name: str) -> PlayState:
+        return PlayState(bot_name, self.to_move, self.current_turn, tuple(self.bombs_data()), self.position.copy())
+
+    def play(self, column) -> bool:
+        # game.gd _spawn plus _update_game, returns True once the game is over
+        mover = self.to_move
+        self.moves.append(column)
+        if not isinstance(column, int) or not 0 <= column < WIDTH or not self.position.can_play(column):
+            # board.insert returned -1, the other player wins
+            self._finish([3 - mover], ILLEGAL)
+            return True
+        self.position.play(column, mover)
+        if self.position.has_won(mover):
+            self._finish([mover], WIN)
+            return True
+        self.to_move = 3 - mover
+        self._next()
+        return self.over()
+
+    def timeout(self):
+        # game.gd player_got_timeout, the active player loses
+        self._finish([3 - self.to_move], TIMEOUT)
+
+    def _finish(self, winners, reason):
+        self.result = GameResult(winners, reason, self.current_turn, self.moves)
+
+    def _next(self):
+        self.current_turn += 1
+        if self.current_turn in self.bomb_drop_turns:
+            self._spawn_bomb()
+            return
+        bomb = self.bomb
+        if bomb is not None and self.current_turn >= bomb.boom_in_round:
+            self.bomb = None
+            self._detonate(bomb)
+
+    def _spawn_bomb(self):
+        # a random column that is not full, game.gd _spawn_bomb
+        columns = self.position.legal_columns()
+        if not columns:
+            return
+        column = columns[self.rng.randrange(len(columns))]
+        row = self.position.heights[column]
+        self.position.drop_bomb(column)
+        self.bomb = Bomb(row, column, self.current_turn + BOOM_IN)
+
+    def _detonate(self, bomb: Bomb):
+        # board.gd update_after_detonation, a full scan finds the winners afterwards
+        position = self.position
+        occupied = position.occupied
+        position.explode(bomb.row, bomb.col)
+        # no coin around the bomb: game.gd skips the winner scan (nothing can fall either)
+        if position.count() == occupied.bit_count() - 1:
+            return
+        winners = position.winners()
+        if winners:
+            self._finish(winners, EXPLOSION)
+
+
+def set_move_time(bot: BotAI, move_ms):
+    # bots with a TimeManager think for move_ms instead of the server timeout minus the margin
+    time_manager = getattr(bot, "time_manager", None)
+    if time_manager is not None and move_ms:
+        time_manager.timeout_ms = move_ms
+        time_manager.safety_margin_ms = 0
+
+
+def play_game(player_one: BotAI, player_two: BotAI, first_player=1, rng=None, timeout_ms=MOVE_TIMEOUT_MS,
+              on_move: Optional[Callable] = None) -> GameResult:
+    # player_one plays coin 1, player_two coin 2. a timeout_ms of None never forfeits.
+    game = Game(first_player, rng)
+    bots = (None, player_one, player_two)
+    player_one.on_new_game()
+    player_two.on_new_game()
+    while not game.over():
+        bot = bots[game.to_move]
+        state = game.play_state(bot.get_name())
+        started_at = perf_counter()
+        bot.start_clock(started_at)
+        column = bot.play(state)
+        elapsed_ms = (perf_counter() - started_at) * 1000
+        if on_move is not None:
+            on_move(game, state, column, elapsed_ms)
+        if timeout_ms is not None and elapsed_ms > timeout_ms:
+            game.timeout()
+            break
+        game.play(column)
+    return game.result
+
+
+@dataclass
+class MatchResult:
+    score: List[int]
+    games: List[GameResult]
+
+
+def play_match(player_one: BotAI, player_two: BotAI, games=GAMES_PER_MATCH, seed=None, sudden_death=False,
+               max_sudden_death_games=GAMES_PER_MATCH, timeout_ms=MOVE_TIMEOUT_MS) -> MatchResult:
+    # best of games like game_manager.gd: every winner gets a point (an explosion can make both
+    # win) and the starting player alternates. game_manager.gd ends a tied match as a draw,
+    # sudden_death keeps playing single games until one player leads.
+    rng = random.Random(seed)
+    score = [0, 0, 0]
+    results = []
+    first_player = 1
+    played = 0
+    while played < games or (sudden_death and score[1] == score[2] and played < games + max_sudden_death_games):
+        result = play_game(player_one, player_two, first_player, rng, timeout_ms)
+        for winner in result.winners:
+            score[winner] += 1
+        results.append(result)
+        first_player = 3 - first_player
+        played += 1
+    return MatchResult(score[1:], results)
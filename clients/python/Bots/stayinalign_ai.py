@@ -1,61 +1,152 @@
-import copy
 from random import randrange
 from time import perf_counter
 
+from Bots.bitboard import CENTER_ORDER, COLUMN_MASKS, HEIGHT, WIDTH, cross_mask
 from Bots.bot_ai import BotAI
 from Bots.data import PlayState
+from Bots.endgame import ENDGAME_EMPTY_CELLS, ENDGAME_TIME_SHARE, EndgameSolver, endgame_ready
+from Bots.move_ordering import MoveOrderer
+from Bots.opening_book import BOOK_PATH, OpeningBook
+from Bots.ponder import Ponderer
+from Bots.search import AlphaBetaSearch, WIN_SCORE, explode_bombs, is_double_threat_move
+from Bots.time_manager import DEFAULT_SAFETY_MARGIN_MS, MOVE_TIMEOUT_MS, SearchTimeout, TimeManager
+from Bots.transposition import DEFAULT_SIZE_MB, TranspositionTable, search_key
+from Bots.weights import WEIGHTS_PATH, load_weights
+
+MAX_DEPTH = WIDTH * HEIGHT
 
 class StayinAlignAI(BotAI):
-    def __init__(self):
+    def __init__(self, tt_size_mb=DEFAULT_SIZE_MB, max_depth=MAX_DEPTH, timeout_ms=MOVE_TIMEOUT_MS,
+                 safety_margin_ms=DEFAULT_SAFETY_MARGIN_MS, ponder=True, opening_book=BOOK_PATH,
+                 endgame_empty_cells=ENDGAME_EMPTY_CELLS, weights=None):
         self.name = "StayinAlign"
+        # EvalWeights of the evaluation, by default Bots/weights.json if tune.py wrote one, else
+        # the untuned defaults of evaluation.py
+        self.weights = weights if weights is not None else load_weights(WEIGHTS_PATH)
+        self.transposition_table = TranspositionTable(tt_size_mb)
+        # killers and history, shared by the search and the ponder search
+        self.move_orderer = MoveOrderer()
+        self.max_depth = max_depth
+        self.time_manager = TimeManager(timeout_ms, safety_margin_ms)
+        self.ponder = ponder
+        self.ponderer = Ponderer()
+        self._ponder_request = None
+        self.search_info = {}
+        # best root move of the deepest finished iteration of the running search, read by
+        # bot.py from the main thread when the search overruns
+        self.best_move = None
+        self._endgame_clock = None
+        # None plays without a book, e.g. while make_book.py builds one
+        self.opening_book = OpeningBook(opening_book) if opening_book else None
+        # 0 switches the endgame solver off
+        self.endgame_empty_cells = endgame_empty_cells
+        self.endgame_solver = EndgameSolver()
+
+    def start_clock(self, started_at):
+        # on the event loop before play() is handed to the helper thread: a deadline that comes
+        # before _play() starts must not find the move of the last state
+        self.best_move = None
+        self.time_manager.start(started_at)
+
+    def start_pondering(self):
+        # our answer is sent, think about the opponent's replies until the next state arrives
+        if self.ponder and self._ponder_request is not None:
+            self.ponderer.start(self._ponder_job, *self._ponder_request)
+        self._ponder_request = None
+
+    def stop_pondering(self):
+        self.ponderer.stop()
+
+    def best_move_so_far(self):
+        return self.best_move
+
+    def stop(self):
+        self.time_manager.abort()
+        endgame_clock = self._endgame_clock
+        if endgame_clock is not None:
+            endgame_clock.abort()
+
+    def on_new_game(self):
+        # positions, history and ponder results of the last game say nothing about the new one
+        self.ponderer.stop()
+        self.ponderer.results = {}
+        self._ponder_request = None
+        self.transposition_table.clear()
+        self.move_orderer.clear()
+        self.endgame_solver.clear()
 
     def play(self, state: PlayState):
-        possible_moves = self.find_possible_moves(state.board)
+        # the helper thread must leave the shared table alone before we search
+        self.ponderer.stop()
+        # without a clock from the client the move time starts now
+        if not self.time_manager.running():
+            self.time_manager.start()
+        try:
+            position = state.position.copy()
+            move = self._play(state, position)
+        finally:
+            self.time_manager.stop()
+        if self.ponder and position.can_play(move) and not position.is_winning_move(move, state.coin_id):
+            position.play(move, state.coin_id)
+            self._ponder_request = (position, state.coin_id, state.round + 1, state.bombs)
+        return move
+
+    def _play(self, state: PlayState, position):
+        self.search_info = {}
+        self.best_move = None
+        possible_moves = self.find_possible_moves(position)
         # if no possible moves, use a random column -> game is lost
         if not possible_moves:
             return randrange(0, 7)
-        # print(possible_moves)
-        
-        if state.round == 1 or state.round == 2:
-            return 3
-        
+
+        # the first moves come from the opening book, positions it does not know are searched
+        if self.opening_book is not None:
+            book_entry = self.opening_book.lookup(position, state.coin_id, state.round)
+            if book_entry is not None:
+                book_move, book_depth, book_score = book_entry
+                self.search_info = {"depth": book_depth, "nodes": 0, "score": book_score, "time_ms": 0, "book": True}
+                return book_move
+
         # find winning moves and use the first one
-        winning_moves = self.find_winning_moves(state.board, state.coin_id, possible_moves)
+        winning_moves = self.find_winning_moves(position, state.coin_id, possible_moves)
         if winning_moves:
             return winning_moves[0]
-        
+
+        # late positions without bombs are solved exactly, the search is only the fallback
+        if self.endgame_empty_cells and endgame_ready(position, state.bombs, state.round, self.endgame_empty_cells):
+            solved_move = self.solve_endgame(position, state.coin_id)
+            if solved_move is not None:
+                return solved_move
+
         # find losing moves and use the first one
-        losing_moves = self.find_losing_moves(state.board, state.coin_id, possible_moves)
+        losing_moves = self.find_losing_moves(position, state.coin_id, possible_moves)
         if losing_moves:
             return losing_moves[0]
-        
+
         # find moves that will give the opponent a winning move
         sensible_moves = possible_moves
-        losing_moves_plus1 = self.find_losing_moves_plus1(state.board, state.coin_id, possible_moves)
+        losing_moves_plus1 = self.find_losing_moves_plus1(position, state.coin_id, possible_moves)
         if losing_moves_plus1:
             blocked_cols = set(losing_moves_plus1)
-            sensible_moves = [move for move in possible_moves if move[0] not in blocked_cols]
-            
+            sensible_moves = [move for move in possible_moves if move not in blocked_cols]
+
         # find double threat moves
-        double_threat_moves = self.find_double_threat_moves(state.board, state.coin_id, sensible_moves)
+        double_threat_moves = self.find_double_threat_moves(position, state.coin_id, sensible_moves)
         if double_threat_moves:
             return double_threat_moves[0]
-        
+
         # find good moves
-        good_moves = self.find_good_moves(state.board, state.coin_id, sensible_moves, 3, state.bombs, state.round)
+        good_moves = self.find_good_moves(position, state.coin_id, sensible_moves, self.max_depth, state.bombs, state.round)
         if good_moves:
             return good_moves[0]
 
-        # fall back to a random move in legal columns
-        sensible_cols = [xCol for xCol, _ in sensible_moves]
         # prefer the middle column
-        if 3 in sensible_cols:
+        if 3 in sensible_moves:
             return 3
-        
+
         # if no more valid columns, use all possible columns -> probably a losing move
-        if not sensible_cols:
-            sensible_cols = [xCol for xCol, _ in possible_moves]
-            
+        sensible_cols = sensible_moves or possible_moves
+
         col = randrange(0, 7)
         while col not in sensible_cols:
             col = randrange(0, 7)
@@ -67,229 +158,182 @@ class StayinAlignAI(BotAI):
             print(row)
         print("")
 
+    def report_search(self):
+        return self.search_info or None
+
     def get_name(self):
         return self.name
-    
-    def find_possible_moves(self, board):
-        # find all possible moves
-        possible_moves = []
-        for xCol in range(7):
-            for yRow in range(6):
-                if board[yRow][xCol] == 0:
-                    possible_moves.append((xCol, yRow))
-                    break
-        return possible_moves
-    
-    def count_direction(self, board, xCol, yRow, xStep, yStep, coin_id):
-        # count the number of coins in a row in the direction (xStep, yStep)
-        count = 0
-        xCol += xStep
-        yRow += yStep
-        while 0 <= xCol < 7 and 0 <= yRow < 6 and board[yRow][xCol] == coin_id:
-            count += 1
-            xCol += xStep
-            yRow += yStep
-        return count
-
-    def count_horizontal(self, board, xCol, yRow, coin_id):
-        # count the number of coins in a row horizontally
-        count = 1
-        count += self.count_direction(board, xCol, yRow, 1, 0, coin_id)
-        count += self.count_direction(board, xCol, yRow, -1, 0, coin_id)
-        return count
-    
-    def count_vertical(self, board, xCol, yRow, coin_id):
-        # count the number of coins in a row vertically
-        count = 1
-        count += self.count_direction(board, xCol, yRow, 0, 1, coin_id)
-        count += self.count_direction(board, xCol, yRow, 0, -1, coin_id)
-        return count
-    
-    def count_diagonal(self, board, xCol, yRow, coin_id):
-        # count the number of coins in a row diagonally
-        diag_down = self.count_direction(board, xCol, yRow, 1, 1, coin_id) + self.count_direction(board, xCol, yRow, -1, -1, coin_id)
-        diag_up = self.count_direction(board, xCol, yRow, 1, -1, coin_id) + self.count_direction(board, xCol, yRow, -1, 1, coin_id)
-        return 1 + max(diag_down, diag_up)
-    
-    def find_winning_moves(self, board, coin_id, possible_moves):
+
+    def find_possible_moves(self, position):
+        # find all columns that are not full
+        return position.legal_columns()
+
+    def find_winning_moves(self, position, coin_id, possible_moves):
         # find all moves that will win the game
-        winning_moves = []
-        for move in possible_moves:
-            xCol, yRow = move
-            horizontal = self.count_horizontal(board, xCol, yRow, coin_id)
-            vertical = self.count_vertical(board, xCol, yRow, coin_id)
-            diagonal = self.count_diagonal(board, xCol, yRow, coin_id)
-            if horizontal >= 4 or vertical >= 4 or diagonal >= 4:
-                winning_moves.append(xCol)
-        return winning_moves
-    
-    def find_losing_moves(self, board, coin_id, possible_moves):
+        wins = position.winning_moves(coin_id)
+        if not wins:
+            return []
+        return [xCol for xCol in possible_moves if wins & COLUMN_MASKS[xCol]]
+
+    def find_losing_moves(self, position, coin_id, possible_moves):
         # find all moves that will lose the game
-        losing_moves = []
         opponent_id = 2 if coin_id == 1 else 1
-        losing_moves = self.find_winning_moves(board, opponent_id, possible_moves)
-        return losing_moves
-
-    def project_board(self, board, coin_id, xCol, yRow):
-        # create a board with the move at xCol, yRow played
-        projected_board = copy.deepcopy(board)
-        projected_board[yRow][xCol] = coin_id
-        return projected_board
-    
-    def find_losing_move_plus1(self, board, coin_id, xCol, yRow):
-        # check if playing at (xCol, yRow) gives opponent a winning move
+        return self.find_winning_moves(position, opponent_id, possible_moves)
+
+    def project_board(self, position, coin_id, xCol):
+        # create a position with the move in xCol played
+        projected = position.copy()
+        projected.play(xCol, coin_id)
+        return projected
+
+    def find_losing_move_plus1(self, position, coin_id, xCol):
+        # check if playing in xCol gives opponent a winning move
         opponent_id = 2 if coin_id == 1 else 1
-        projected_board = self.project_board(board, coin_id, xCol, yRow)
-        opponent_moves = self.find_possible_moves(projected_board)
-        opponent_wins = self.find_winning_moves(projected_board, opponent_id, opponent_moves)
-        return len(opponent_wins) > 0
-    
-    def find_losing_moves_plus1(self, board, coin_id, possible_moves):
+        position.play(xCol, coin_id)
+        try:
+            return position.winning_moves(opponent_id) != 0
+        finally:
+            position.undo(xCol, coin_id)
+
+    def find_losing_moves_plus1(self, position, coin_id, possible_moves):
         # find all moves that will give the opponent a winning move
-        losing_moves_plus1 = []
-        for move in possible_moves:
-            xCol, yRow = move
-            if self.find_losing_move_plus1(board, coin_id, xCol, yRow):
-                losing_moves_plus1.append(xCol)
-        return losing_moves_plus1
-
-    def find_double_threat_moves(self, board, coin_id, possible_moves):
-        # find all moves that will create a double threat
-        double_threat_moves = []
-        for move in possible_moves:
-            xCol, yRow = move
-            if self.find_double_threat_move(board, coin_id, xCol, yRow):
-                double_threat_moves.append(xCol)
-        return double_threat_moves
-    
-    def find_double_threat_move(self, board, coin_id, xCol, yRow):
-        opponent_id = 2 if coin_id == 1 else 1
-        projected_board = self.project_board(board, coin_id, xCol, yRow)
-        opponent_moves = self.find_possible_moves(projected_board)
-        double_threat_count = 0
-
-        for opp_xCol, opp_yRow in opponent_moves:
-            opp_projected = self.project_board(projected_board, opponent_id, opp_xCol, opp_yRow)
-            my_moves = self.find_possible_moves(opp_projected)
-            my_winning_moves = self.find_winning_moves(opp_projected, coin_id, my_moves)
-            if len(my_winning_moves) >= 2:
-                return True
-
-        return False
-
-    def simulate_bomb(self, board, bombs):
-        if not bombs:
-            return board
-
-        exploded = copy.deepcopy(board)
-        for bomb in bombs:
-            row = bomb.get("row")
-            col = bomb.get("col")
-            if row is None or col is None:
-                continue
-            for dRow, dCol in ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1)):
-                r = row + dRow
-                c = col + dCol
-                if 0 <= r < 6 and 0 <= c < 7:
-                    exploded[r][c] = 0
-
-        # apply gravity
-        for c in range(7):
-            stack = [exploded[r][c] for r in range(6) if exploded[r][c] != 0]
-            for r in range(6):
-                exploded[r][c] = 0
-            for idx, val in enumerate(stack):
-                exploded[idx][c] = val
-
-        return exploded
-
-    def find_good_moves(self, board, coin_id, possible_moves, depth, bombs, current_round):
-        # find all moves that are good, plan number of depth moves ahead
-        # plan our and opponent moves and find the best move
-        if depth <= 0 or not possible_moves:
-            return [xCol for xCol, _ in possible_moves]
+        return [xCol for xCol in possible_moves if self.find_losing_move_plus1(position, coin_id, xCol)]
 
-        opponent_id = 2 if coin_id == 1 else 1
+    def find_double_threat_moves(self, position, coin_id, possible_moves):
+        # find all moves that will create a double threat
+        return [xCol for xCol in possible_moves if self.find_double_threat_move(position, coin_id, xCol)]
 
-        def is_win(current_board, player, xCol, yRow):
-            return (
-                self.count_horizontal(current_board, xCol, yRow, player) >= 4
-                or self.count_vertical(current_board, xCol, yRow, player) >= 4
-                or self.count_diagonal(current_board, xCol, yRow, player) >= 4
-            )
-
-        def heuristic(current_board, current_round):
-            # quick, cheap evaluation: immediate wins and double threats
-            moves = self.find_possible_moves(current_board)
-            my_wins = len(self.find_winning_moves(current_board, coin_id, moves))
-            opponent_wins = len(self.find_winning_moves(current_board, opponent_id, moves))
-            my_double_threats = len(self.find_double_threat_moves(current_board, coin_id, moves))
-            bomb_score = 0
-            if bombs:
-                soonest = min(b.get("explode_in_round", 1000) - current_round for b in bombs)
-                # only project the explosion if it will happen within the search horizon
-                if soonest <= depth:
-                    post_board = self.simulate_bomb(current_board, bombs)
-                    post_moves = self.find_possible_moves(post_board)
-                    post_my_wins = len(self.find_winning_moves(post_board, coin_id, post_moves))
-                    post_opponent_wins = len(self.find_winning_moves(post_board, opponent_id, post_moves))
-                    bomb_score += (post_my_wins - post_opponent_wins) * 20
-            return my_wins * 50 + my_double_threats * 10 - opponent_wins * 50 + bomb_score
-
-        def score(current_board, current_player, current_depth, alpha, beta, current_round):
-            moves = self.find_possible_moves(current_board)
-            if current_depth == 0 or not moves:
-                return heuristic(current_board, current_round)
-
-            maximizing = current_player == coin_id
-            best_val = -10_000 if maximizing else 10_000
-
-            for xMove, yMove in moves:
-                current_board[yMove][xMove] = current_player
-                try:
-                    if is_win(current_board, current_player, xMove, yMove):
-                        value = 500 if maximizing else -500
-                    else:
-                        next_player = opponent_id if maximizing else coin_id
-                        value = score(current_board, next_player, current_depth - 1, alpha, beta, current_round + 1)
-                finally:
-                    current_board[yMove][xMove] = 0
+    def find_double_threat_move(self, position, coin_id, xCol):
+        return is_double_threat_move(position, coin_id, xCol)
 
-                if maximizing:
-                    if value > best_val:
-                        best_val = value
-                    if best_val > alpha:
-                        alpha = best_val
-                else:
-                    if value < best_val:
-                        best_val = value
-                    if best_val < beta:
-                        beta = best_val
+    def simulate_bomb(self, position, bombs):
+        return explode_bombs(position, bombs)
 
-                if alpha >= beta:
-                    break
+    def solve_endgame(self, position, coin_id):
+        # proven best column, or None if the solver did not finish in its share of the time
+        clock = TimeManager(self.time_manager.remaining_ms() * ENDGAME_TIME_SHARE, 0)
+        clock.start()
+        self._endgame_clock = clock
+        started_at = perf_counter()
+        try:
+            value, move = self.endgame_solver.solve(position, coin_id, clock)
+        except SearchTimeout:
+            return None
+        finally:
+            self._endgame_clock = None
+        self.search_info = {
+            "depth": WIDTH * HEIGHT - position.count(),
+            "nodes": self.endgame_solver.nodes,
+            "score": value,
+            "time_ms": round((perf_counter() - started_at) * 1000, 2),
+            "endgame": True,
+        }
+        return move
 
-            return best_val
+    def find_good_moves(self, position, coin_id, possible_moves, depth, bombs, current_round):
+        # find all moves that are good, plan up to depth moves ahead with iterative deepening
+        # plan our and opponent moves and find the best move of the deepest finished search
+        if depth <= 0 or not possible_moves:
+            return list(possible_moves)
 
+        time_manager = self.time_manager
+        self.transposition_table.new_search()
+        self.move_orderer.new_search()
+        self.move_orderer.reset_stats()
+        search = AlphaBetaSearch(position, coin_id, bombs, self.transposition_table, time_manager, self.weights,
+                                 orderer=self.move_orderer)
+        started_at = perf_counter()
         best_moves = []
-        best_score = -10_000
-        for xCol, yRow in possible_moves:
-            board[yRow][xCol] = coin_id
+        best_score = None
+        completed_depth = 0
+        root_moves = list(possible_moves)
+
+        # a ponder search of this very position already finished some iterations
+        ponder_result = None
+        if self.ponderer.results:
+            ponder_result = self.ponderer.lookup((position.hash, current_round, search.explode_round))
+        if ponder_result is not None:
+            ponder_depth, ponder_score, ponder_moves = ponder_result
+            ponder_moves = [xCol for xCol in ponder_moves if xCol in possible_moves]
+            if ponder_moves:
+                best_moves = ponder_moves
+                best_score = ponder_score
+                completed_depth = min(ponder_depth, depth)
+                self.best_move = min(best_moves, key=CENTER_ORDER.index)
+                root_moves = best_moves + [xCol for xCol in root_moves if xCol not in best_moves]
+
+        for iteration_depth in range(completed_depth + 1, depth + 1):
+            iteration_started_at = perf_counter()
             try:
-                if is_win(board, coin_id, xCol, yRow):
-                    move_score = 1_000
-                else:
-                    move_score = score(board, opponent_id, depth - 1, -10_000, 10_000, current_round + 1)
-            finally:
-                board[yRow][xCol] = 0
-
-            if move_score > best_score:
-                best_score = move_score
-                best_moves = [xCol]
-            elif move_score == best_score:
-                best_moves.append(xCol)
+                best_score, best_moves = search.search_root(root_moves, iteration_depth, current_round)
+            except SearchTimeout:
+                break
+            completed_depth = iteration_depth
+            self.best_move = min(best_moves, key=CENTER_ORDER.index)
+            # the best moves of this iteration are searched first in the next one
+            root_moves = best_moves + [xCol for xCol in root_moves if xCol not in best_moves]
+            if abs(best_score) >= WIN_SCORE or iteration_depth >= MAX_DEPTH - position.count():
+                # proven result or nothing left to search
+                break
+            if not time_manager.can_start_iteration((perf_counter() - iteration_started_at) * 1000):
+                break
 
+        self.search_info = {
+            "depth": completed_depth,
+            "nodes": search.nodes,
+            "score": best_score,
+            "time_ms": round((perf_counter() - started_at) * 1000, 2),
+            "ponder_hit": ponder_result is not None,
+            **self.move_orderer.stats(),
+        }
         if len(best_moves) > 1:
-            priority = {col: idx for idx, col in enumerate((3, 2, 4, 1, 5, 0, 6))}
+            priority = {col: idx for idx, col in enumerate(CENTER_ORDER)}
             best_moves.sort(key=lambda col: priority.get(col, len(priority)))
         return best_moves
+
+    def _ponder_job(self, clock, position, coin_id, current_round, bombs):
+        # runs on the helper thread: position is after our move, the opponent is to move in
+        # current_round. every reply gets an ever deeper search of our answer, the results
+        # land in the transposition table and in ponderer.results.
+        opponent_id = 2 if coin_id == 1 else 1
+        table = self.transposition_table
+        table.new_search()
+        explode_round = min((b.get("explode_in_round", 0) for b in bombs), default=0) if bombs else 0
+
+        # the reply our own search expected comes first
+        replies = [xCol for xCol in CENTER_ORDER
+                   if position.can_play(xCol) and not position.is_winning_move(xCol, opponent_id)]
+        entry = table.probe(search_key(position.hash, opponent_id, current_round, explode_round, coin_id))
+        if entry is not None and entry[3] in replies:
+            replies.remove(entry[3])
+            replies.insert(0, entry[3])
+
+        answer_round = current_round + 1
+        max_depth = min(self.max_depth, MAX_DEPTH - position.count() - 1)
+        # bombs that go off right before our next move, the next state shows the board after it
+        exploding = [b for b in bombs if b.get("explode_in_round") == answer_round] if bombs else []
+        remaining_bombs = [b for b in bombs if b not in exploding] if exploding else bombs
+        blast = 0
+        for bomb in exploding:
+            blast |= cross_mask(bomb["row"], bomb["col"])
+        for depth in range(1, max_depth + 1):
+            for reply in replies:
+                position.play(reply, opponent_id)
+                saved = None
+                search_bombs = bombs
+                try:
+                    if exploding:
+                        saved = position.save()
+                        position.detonate(blast)
+                        search_bombs = remaining_bombs
+                    moves = position.legal_columns()
+                    if not moves or position.winners():
+                        continue
+                    search = AlphaBetaSearch(position, coin_id, search_bombs, table, clock, self.weights,
+                                             orderer=self.move_orderer)
+                    best_score, best_moves = search.search_root(moves, depth, answer_round)
+                    self.ponderer.record((position.hash, answer_round, search.explode_round), depth, best_score, best_moves)
+                finally:
+                    if saved is not None:
+                        position.restore(saved)
+                    position.undo(reply, opponent_id)
@@ -0,0 +1,80 @@
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+
+# precomputed tables in one binary file, written once by make_tables.py and mapped read only
+# at import. a layout is a tuple of (name, typecode, count), typecode "Q" or "B". the file is:
+# header, one directory entry per table, then the tables little endian, each aligned to 8.
+# the signature of the header is a crc of whatever the tables were computed from (board size,
+# seed, layout), a file that does not match it or its data crc is ignored and the tables are
+# computed as before.
+MAGIC = b"C4TB"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHII")
+_ENTRY = struct.Struct("<16scxxxII")
+_ALIGN = 8
+
+
+def signature(*parts):
+    return zlib.crc32(repr(parts).encode())
+
+
+def _offsets(layout):
+    offset = _HEADER.size + len(layout) * _ENTRY.size
+    offsets = []
+    for _, typecode, count in layout:
+        offset = -(-offset // _ALIGN) * _ALIGN
+        offsets.append(offset)
+        offset += count * array(typecode).itemsize
+    return offsets, offset
+
+
+def write_tables(path, layout, tables_signature, tables):
+    # tables maps every name of the layout to a sequence of count values. returns the size.
+    offsets, size = _offsets(layout)
+    data = bytearray(size)
+    for index, ((name, typecode, count), offset) in enumerate(zip(layout, offsets)):
+        values = array(typecode, tables[name])
+        if len(values) != count:
+            raise ValueError(f"table {name} has {len(values)} values, the layout says {count}")
+        if sys.byteorder != "little":
+            values.byteswap()
+        _ENTRY.pack_into(data, _HEADER.size + index * _ENTRY.size, name.encode(), typecode.encode(), count, offset)
+        data[offset:offset + len(values) * values.itemsize] = values.tobytes()
+    body = memoryview(data)[_HEADER.size:]
+    _HEADER.pack_into(data, 0, MAGIC, VERSION, len(layout), tables_signature, zlib.crc32(body))
+    with open(path, "wb") as file:
+        file.write(data)
+    return size
+
+
+def load_tables(path, layout, tables_signature):
+    # {name: memoryview of the values} or None for a missing, broken or outdated file. the
+    # views stay valid as long as they are referenced, the mapping is never closed by hand.
+    if sys.byteorder != "little":
+        return None
+    try:
+        with open(path, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    offsets, size = _offsets(layout)
+    if len(data) != size:
+        data.close()
+        return None
+    magic, version, count, file_signature, data_crc = _HEADER.unpack_from(data)
+    view = memoryview(data)
+    if magic != MAGIC or version != VERSION or count != len(layout) or file_signature != tables_signature \
+            or zlib.crc32(view[_HEADER.size:]) != data_crc:
+        view.release()
+        data.close()
+        return None
+    tables = {}
+    for index, ((name, typecode, count), offset) in enumerate(zip(layout, offsets)):
+        entry = _ENTRY.unpack_from(data, _HEADER.size + index * _ENTRY.size)
+        if entry != (name.encode().ljust(16, b"\0"), typecode.encode(), count, offset):
+            return None
+        tables[name] = view[offset:offset + count * array(typecode).itemsize].cast(typecode)
+    return tables
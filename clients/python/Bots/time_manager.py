@@ -0,0 +1,56 @@
+from time import perf_counter
+
+# the server forfeits a bot that needs longer than this, see websocket_server.gd
+MOVE_TIMEOUT_MS = 700
+# time kept back for sending the answer, garbage collection and a slow host
+DEFAULT_SAFETY_MARGIN_MS = 200
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class TimeManager:
+    def __init__(self, timeout_ms=MOVE_TIMEOUT_MS, safety_margin_ms=DEFAULT_SAFETY_MARGIN_MS):
+        self.timeout_ms = timeout_ms
+        self.safety_margin_ms = safety_margin_ms
+        self.started_at = None
+        self.deadline = None
+
+    def budget_ms(self):
+        return max(0, self.timeout_ms - self.safety_margin_ms)
+
+    def start(self, started_at=None):
+        # started_at should be the moment the message arrived, not the moment play() begins
+        self.started_at = perf_counter() if started_at is None else started_at
+        self.deadline = self.started_at + self.budget_ms() / 1000
+
+    def stop(self):
+        self.started_at = None
+        self.deadline = None
+
+    def abort(self):
+        # may be called from another thread, the next check() raises SearchTimeout
+        if self.deadline is not None:
+            self.deadline = 0.0
+
+    def running(self):
+        return self.started_at is not None
+
+    def elapsed_ms(self):
+        return (perf_counter() - self.started_at) * 1000
+
+    def remaining_ms(self):
+        return (self.deadline - perf_counter()) * 1000
+
+    def expired(self):
+        return perf_counter() >= self.deadline
+
+    def check(self):
+        if perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def can_start_iteration(self, last_iteration_ms, growth=3.0):
+        # the next iteration takes about growth times as long as the last one, do not start
+        # it when it would not finish anyway
+        return last_iteration_ms * growth < self.remaining_ms()
@@ -0,0 +1,147 @@
+from array import array
+
+from Bots.bitboard import EXPLODE_KEYS, ROUND_KEYS, SIDE_KEYS
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+NO_MOVE = -1
+
+# one entry is a 64 bit key plus a 64 bit packed value
+ENTRY_BYTES = 16
+DEFAULT_SIZE_MB = 32
+# the contest allows 512 MB RAM for the whole bot, the table never takes more than this
+MAX_SIZE_MB = 256
+
+_SCORE_OFFSET = 1 << 15
+# added to the salt per clear(), odd so the salts do not repeat
+_SALT_STEP = 0x9E3779B97F4A7C15
+
+
+def search_key(position_hash, player, current_round, explode_round=0, perspective=1):
+    # the stored value depends on the cells, who is to move, the round (bomb timing) and
+    # which coin the evaluation is scored for
+    key = position_hash ^ ROUND_KEYS[current_round & 127] ^ SIDE_KEYS[player]
+    if explode_round:
+        key ^= EXPLODE_KEYS[explode_round & 127]
+    if perspective == 2:
+        key = ~key & 0xFFFFFFFFFFFFFFFF
+    return key
+
+
+class TranspositionTable:
+    # fixed size hash table in two flat arrays. buckets have two slots: the first keeps the
+    # deepest (or newest search) entry, the second is always replaced.
+    def __init__(self, size_mb=DEFAULT_SIZE_MB):
+        size_mb = max(1, min(size_mb, MAX_SIZE_MB))
+        entries = 2
+        while entries * 2 * ENTRY_BYTES <= size_mb * 1024 * 1024:
+            entries *= 2
+        self.size = entries
+        self.bucket_mask = (entries - 1) & ~1
+        # repeating one zero fills the array in place, no zeroed bytes object to copy from
+        self.keys = array("Q", [0]) * entries
+        self.values = array("Q", [0]) * entries
+        self.generation = 0
+        # xored into every key, see clear()
+        self.salt = 0
+        # generations written since the last clear(), the current one included
+        self.game_generations = 1
+        self.hits = 0
+        self.misses = 0
+        self.cutoffs = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def size_mb(self):
+        return self.size * ENTRY_BYTES / (1024 * 1024)
+
+    def new_search(self):
+        # entries of older searches may be replaced even if they are deeper
+        self.generation = (self.generation + 1) & 0xFF
+        self.game_generations = min(self.game_generations + 1, 256)
+
+    def clear(self):
+        # in place: on_new_game() runs inside the time of the first move, reallocating 32 MB
+        # cost 10-20 ms of it. under a new salt every stored key misses, and the new generation
+        # lets store() replace the old entries first.
+        self.salt = (self.salt + _SALT_STEP) & 0xFFFFFFFFFFFFFFFF
+        self.new_search()
+        self.game_generations = 1
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.cutoffs = 0
+        self.stores = 0
+        self.replacements = 0
+
+    def probe(self, key):
+        # returns (depth, flag, score, move) or None
+        key ^= self.salt
+        index = key & self.bucket_mask
+        keys = self.keys
+        if keys[index] != key:
+            index += 1
+            if keys[index] != key:
+                self.misses += 1
+                return None
+        self.hits += 1
+        value = self.values[index]
+        return ((value >> 16) & 0x3F, (value >> 22) & 0x3, (value & 0xFFFF) - _SCORE_OFFSET,
+                ((value >> 24) & 0xF) - 1)
+
+    def store(self, key, depth, flag, score, move=NO_MOVE):
+        value = ((score + _SCORE_OFFSET) & 0xFFFF) | (depth & 0x3F) << 16 | flag << 22 \
+            | (move + 1) << 24 | self.generation << 28
+        key ^= self.salt
+        index = key & self.bucket_mask
+        keys = self.keys
+        values = self.values
+        self.stores += 1
+        first_key = keys[index]
+        if first_key == key or first_key == 0:
+            keys[index] = key
+            values[index] = value
+            return
+        second_key = keys[index + 1]
+        if second_key and second_key != key:
+            self.replacements += 1
+        first = values[index]
+        if depth >= (first >> 16) & 0x3F or (first >> 28) != self.generation:
+            # the new entry takes the depth preferred slot, the old one moves down
+            keys[index + 1] = first_key
+            values[index + 1] = first
+            keys[index] = key
+            values[index] = value
+        else:
+            keys[index + 1] = key
+            values[index + 1] = value
+
+    def used(self):
+        # share of filled slots in the first 1000 buckets, like the hashfull value of uci engines.
+        # entries from before the last clear() are stale and count as free.
+        sample = min(self.size, 2000)
+        keys = self.keys
+        values = self.values
+        generation = self.generation
+        live = self.game_generations
+        return sum(1 for index in range(sample)
+                   if keys[index] and (generation - (values[index] >> 28)) & 0xFF < live) / sample
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            "size_mb": round(self.size_mb(), 1),
+            "entries": self.size,
+            "probes": probes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / probes, 3) if probes else 0.0,
+            "cutoffs": self.cutoffs,
+            "stores": self.stores,
+            "replacements": self.replacements,
+            "used": round(self.used(), 3),
+        }
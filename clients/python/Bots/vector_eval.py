@@ -0,0 +1,140 @@
+import random
+from time import perf_counter
+
+from Bots.bitboard import BOARD_MASK, BOTTOM_MASK, HEIGHT, WIDTH, Position
+from Bots.evaluation import DEFAULT_WEIGHTS, EVEN_ROWS, ODD_ROWS, bomb_win_difference, evaluate
+
+# numpy is optional, without it the scalar evaluator in evaluation.py is used everywhere. it
+# is imported on the first available() call: the import takes longer than the rest of the
+# engine together and most searches never batch.
+np = None
+_numpy_checked = False
+
+BATCH_SIZES = (1, 2, 4, 7, 16, 49, 128, 343, 1024)
+
+
+def available():
+    global np, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+    return np is not None
+
+
+def _winning_cells(stones):
+    # evaluation.py winning_cells on a whole array of bitboards, every four cell window of all
+    # boards in one pass. bits shifted out of the 64 bits are off the board anyway.
+    cells = (stones << 1) & (stones << 2) & (stones << 3)
+    for shift in (7, 6, 8):
+        pair = (stones << shift) & (stones << 2 * shift)
+        cells |= pair & (stones << 3 * shift)
+        cells |= pair & (stones >> shift)
+        pair = (stones >> shift) & (stones >> 2 * shift)
+        cells |= pair & (stones << shift)
+        cells |= pair & (stones >> 3 * shift)
+    return cells & np.uint64(BOARD_MASK)
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values).astype(np.int64)
+    # numpy < 2.0: count the bits of every byte
+    return np.unpackbits(values.view(np.uint8)).reshape(len(values), 64).sum(axis=1, dtype=np.int64)
+
+
+def evaluate_arrays(stones_one, stones_two, occupied, coin_id, current_players, weights=DEFAULT_WEIGHTS):
+    # threat part of evaluation.evaluate for arrays of boards, returns an int64 array.
+    # current_players is a single coin id or one per board.
+    playable = (occupied + np.uint64(BOTTOM_MASK)) & np.uint64(BOARD_MASK)
+    empty = ~occupied
+    features = []
+    for stones in ((stones_one, stones_two) if coin_id == 1 else (stones_two, stones_one)):
+        open_cells = _winning_cells(stones) & empty
+        wins = open_cells & playable
+        doubles = _popcount(open_cells & (open_cells >> 1) & playable) + (_popcount(wins) >= 2)
+        features.append((_popcount(wins), doubles, open_cells & ~playable))
+    (my_wins, my_doubles, my_latent), (opponent_wins, opponent_doubles, opponent_latent) = features
+
+    empty_count = WIDTH * HEIGHT - _popcount(occupied)
+    mover_rows = np.where(empty_count % 2 == 0, np.uint64(ODD_ROWS), np.uint64(EVEN_ROWS))
+    my_rows = np.where(np.asarray(current_players) == coin_id, mover_rows, mover_rows ^ np.uint64(ODD_ROWS | EVEN_ROWS))
+    my_parity = _popcount(my_latent & my_rows)
+    opponent_parity = _popcount(opponent_latent & ~my_rows)
+
+    return (weights.win * (my_wins - opponent_wins)
+            + weights.double_threat * (my_doubles - opponent_doubles)
+            + weights.threat * (_popcount(my_latent) - _popcount(opponent_latent))
+            + weights.parity * (my_parity - opponent_parity))
+
+
+def evaluate_batch(positions, coin_id, current_players, bombs=None, current_round=0, bomb_horizon=0,
+                   weights=DEFAULT_WEIGHTS):
+    # the scores evaluation.evaluate gives every position, as a list of ints
+    if not available():
+        raise RuntimeError("numpy is not installed")
+    count = len(positions)
+    stones_one = np.fromiter((position.stones[1] for position in positions), np.uint64, count)
+    stones_two = np.fromiter((position.stones[2] for position in positions), np.uint64, count)
+    occupied = np.fromiter((position.occupied for position in positions), np.uint64, count)
+    scores = evaluate_arrays(stones_one, stones_two, occupied, coin_id, current_players, weights).tolist()
+    if bombs:
+        # the explosion moves stones column by column, it stays scalar
+        soonest = min(b.get("explode_in_round", 1000) - current_round for b in bombs)
+        if soonest <= bomb_horizon:
+            for index, position in enumerate(positions):
+                scores[index] += weights.bomb * bomb_win_difference(position, coin_id, bombs)
+    return scores
+
+
+def _random_positions(count, rng):
+    positions = []
+    while len(positions) < count:
+        position = Position()
+        coin_id = 1
+        for _ in range(rng.randrange(4, 36)):
+            moves = [col for col in position.legal_columns() if not position.is_winning_move(col, coin_id)]
+            if not moves:
+                break
+            position.play(rng.choice(moves), coin_id)
+            coin_id = 3 - coin_id
+        positions.append(position.copy())
+    return positions
+
+
+def batch_report(seed=1, repeats=20):
+    # checks the batched scores against the scalar ones and times both per position for
+    # every batch size. returns one row per batch size.
+    rng = random.Random(seed)
+    rows = []
+    for size in BATCH_SIZES:
+        positions = _random_positions(size, rng)
+        players = [rng.choice((1, 2)) for _ in positions]
+        scalar = [evaluate(position, 1, player) for position, player in zip(positions, players)]
+        batched = evaluate_batch(positions, 1, players)
+        if scalar != batched:
+            raise AssertionError(f"batched scores differ from the scalar evaluator at batch size {size}")
+
+        started_at = perf_counter()
+        for _ in range(repeats):
+            for position, player in zip(positions, players):
+                evaluate(position, 1, player)
+        scalar_us = (perf_counter() - started_at) / (repeats * size) * 1e6
+        started_at = perf_counter()
+        for _ in range(repeats):
+            evaluate_batch(positions, 1, players)
+        batch_us = (perf_counter() - started_at) / (repeats * size) * 1e6
+        rows.append({"batch": size, "scalar_us": round(scalar_us, 2), "batch_us": round(batch_us, 2),
+                     "speedup": round(scalar_us / batch_us, 2)})
+    return rows
+
+
+if __name__ == "__main__":
+    if not available():
+        raise SystemExit("numpy is not installed")
+    print(f"{'batch':>6} {'scalar us':>10} {'batched us':>11} {'speedup':>8}   (per position)")
+    for row in batch_report():
+        print(f"{row['batch']:>6} {row['scalar_us']:>10} {row['batch_us']:>11} {row['speedup']:>8}")
@@ -0,0 +1,29 @@
+import json
+import os
+from dataclasses import asdict, fields
+
+from Bots.evaluation import DEFAULT_WEIGHTS, EvalWeights
+
+# written by tune.py, read by StayinAlignAI at startup. no tuned file is shipped yet, without
+# it the bot plays with the hand set defaults of EvalWeights.
+WEIGHTS_PATH = os.path.join(os.path.dirname(__file__), "weights.json")
+
+
+def load_weights(path=WEIGHTS_PATH):
+    # a missing weight keeps its default, an unknown one is an error so a typo does not go unnoticed
+    try:
+        with open(path) as file:
+            values = json.load(file)
+    except FileNotFoundError:
+        return DEFAULT_WEIGHTS
+    names = {field.name for field in fields(EvalWeights)}
+    unknown = set(values) - names
+    if unknown:
+        raise ValueError(f"{path}: unknown weights {sorted(unknown)}")
+    return EvalWeights(**{name: int(value) for name, value in values.items()})
+
+
+def save_weights(weights: EvalWeights, path=WEIGHTS_PATH):
+    with open(path, "w") as file:
+        json.dump(asdict(weights), file, indent=2)
+        file.write("\n")
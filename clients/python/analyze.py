@@ -0,0 +1,172 @@
+import argparse
+import contextlib
+import io
+import json
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from os import cpu_count
+from time import perf_counter
+
+from Bots.aiFactory import ai_bots, ai_factory
+from Bots.bitboard import BOMB_ID, HEIGHT, WIDTH
+from Bots.data import PlayState
+from Bots.simulator import set_move_time
+
+# reads PlayState-shaped json lines ({"coin_id", "round", "bombs", "board"}, "bot" is
+# optional) from a file or stdin, e.g. replay.py --format jsonl or benchmark corpora turned
+# into lines, and writes one json line per position: the input fields plus best_move, score,
+# depth, nodes and time_ms. a line that cannot be read gets an "error" instead.
+# only a few positions per worker are in flight, memory stays flat however long the input is.
+# the results come in input order unless --unordered.
+IN_FLIGHT_PER_WORKER = 4
+# with ordered output, lines open (submitted, not written) per line in flight
+REORDER_WINDOW = 8
+# think time of a depth limited search, the depth should end it long before
+DEPTH_MOVE_MS = 600_000
+CELL_VALUES = (0, 1, 2, BOMB_ID)
+BOMB_FIELDS = ("row", "col", "explode_in_round")
+
+_bot = None
+
+
+def _start_worker(bot_name, move_ms, depth):
+    global _bot
+    _bot = ai_factory(bot_name)
+    if depth and hasattr(_bot, "max_depth"):
+        _bot.max_depth = depth
+        move_ms = move_ms or DEPTH_MOVE_MS
+    set_move_time(_bot, move_ms)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def check_position(data):
+    # what is wrong with a decoded line, None if a bot can play it
+    if not isinstance(data, dict):
+        return f"not an object but {type(data).__name__}"
+    if data.get("coin_id") not in (1, 2) or not _is_int(data["coin_id"]):
+        return "coin_id must be 1 or 2"
+    if not _is_int(data.get("round")) or data["round"] < 1:
+        return "round must be a positive int"
+    board = data.get("board")
+    if not isinstance(board, list) or len(board) != HEIGHT \
+            or any(not isinstance(row, list) or len(row) != WIDTH for row in board):
+        return f"board must be {HEIGHT} rows of {WIDTH} cells"
+    if any(not _is_int(cell) or cell not in CELL_VALUES for row in board for cell in row):
+        return f"board cells must be one of {CELL_VALUES}"
+    bombs = data.get("bombs")
+    if not isinstance(bombs, list) or any(not isinstance(bomb, dict) or not all(_is_int(bomb.get(name))
+                                                                                for name in BOMB_FIELDS)
+                                          for bomb in bombs):
+        return f"bombs must be a list of objects with int {', '.join(BOMB_FIELDS)}"
+    if "bot" in data and not isinstance(data["bot"], str):
+        return "bot must be a string"
+    return None
+
+
+def analyse(index, line):
+    # one position on a fresh game, nothing of the position before is left in the tables.
+    # whatever goes wrong with one line becomes its error record, the run goes on.
+    try:
+        data = json.loads(line)
+    except ValueError as error:
+        return {"index": index, "error": f"bad json: {error}"}
+    problem = check_position(data)
+    if problem is not None:
+        return {"index": index, "error": f"bad position: {problem}"}
+    data.setdefault("bot", _bot.get_name())
+    _bot.on_new_game()
+    try:
+        state = PlayState.from_dict(data)
+        with contextlib.redirect_stdout(io.StringIO()):
+            started_at = perf_counter()
+            _bot.start_clock(started_at)
+            move = _bot.play(state)
+            elapsed_ms = (perf_counter() - started_at) * 1000
+    except Exception as error:
+        return {"index": index, "error": f"analysis failed: {error!r}"}
+    finally:
+        _bot.stop_pondering()
+    info = _bot.report_search() or {}
+    return {**data, "index": index, "best_move": move, "score": info.get("score"), "depth": info.get("depth"),
+            "nodes": info.get("nodes"), "time_ms": round(elapsed_ms, 2)}
+
+
+def read_lines(file):
+    # (index, line) of every line with content, the index counts all lines from 0
+    for index, line in enumerate(file):
+        if line.strip():
+            yield index, line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyses json lines of positions with a bot on all cores")
+    parser.add_argument("input", nargs="?", default="-", help="file with one position per line, - for stdin")
+    parser.add_argument("--bot", default="StayinAlignAI", choices=sorted(ai_bots))
+    parser.add_argument("--move-ms", type=float, default=0,
+                        help="think time per position for bots with a time manager (default: their own)")
+    parser.add_argument("--depth", type=int, default=0,
+                        help="search depth per position for bots with max_depth, no time limit unless --move-ms")
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1)
+    parser.add_argument("--unordered", action="store_true", help="write results as they finish, not in input order")
+    parser.add_argument("--output", help="write the results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    sink = open(args.output, "w") if args.output else sys.stdout
+    in_flight = args.workers * IN_FLIGHT_PER_WORKER
+    started_at = perf_counter()
+    written = 0
+    errors = 0
+    lines = read_lines(source)
+    running = set()
+    # ordered output: lines submitted but not written yet, in input order, and the results
+    # that wait for a slower line before them. at most REORDER_WINDOW * in_flight lines are
+    # open at once, a slow position holds the output back but not the memory.
+    open_lines = deque()
+    finished = {}
+
+    def write(result):
+        nonlocal written, errors
+        sink.write(json.dumps(result) + "\n")
+        written += 1
+        errors += "error" in result
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_start_worker,
+                                 initargs=(args.bot, args.move_ms, args.depth)) as pool:
+            while True:
+                while len(running) < in_flight and len(open_lines) < in_flight * REORDER_WINDOW:
+                    entry = next(lines, None)
+                    if entry is None:
+                        break
+                    if not args.unordered:
+                        open_lines.append(entry[0])
+                    running.add(pool.submit(analyse, *entry))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    if args.unordered:
+                        write(result)
+                    else:
+                        finished[result["index"]] = result
+                while open_lines and open_lines[0] in finished:
+                    write(finished.pop(open_lines.popleft()))
+                sink.flush()
+                print(f"\r{written} positions, {written / (perf_counter() - started_at):.1f}/s", end="",
+                      file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    print(f"\r{written} positions in {perf_counter() - started_at:.1f} s, {errors} errors", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import math
+import random
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from os import cpu_count
+from time import perf_counter
+
+from Bots.aiFactory import ai_bots, ai_factory
+from Bots.simulator import GAMES_PER_MATCH, play_match, set_move_time
+from Bots.time_manager import MOVE_TIMEOUT_MS
+from profiling import DEFAULT_TOP, MoveProfiler
+
+
+def run_match(name_one, name_two, seed, games, sudden_death, timeout_ms, move_ms, profile_top=0):
+    # one match in a worker process, bot_one is player one (coin 1) and starts the first game.
+    # with profile_top the slowest moves of the match come back for the profile of the arena.
+    random.seed(seed)
+    bot_one = ai_factory(name_one)
+    bot_two = ai_factory(name_two)
+    profiler = None
+    if profile_top:
+        profiler = MoveProfiler(profile_top)
+        profiler.attach(bot_one)
+        profiler.attach(bot_two)
+    set_move_time(bot_one, move_ms)
+    set_move_time(bot_two, move_ms)
+    try:
+        # some bots print every board, that output is of no use here
+        with contextlib.redirect_stdout(io.StringIO()):
+            match = play_match(bot_one, bot_two, games, seed, sudden_death, timeout_ms=timeout_ms)
+    finally:
+        bot_one.stop_pondering()
+        bot_two.stop_pondering()
+    games_out = [{"winners": game.winners, "reason": game.reason, "turns": game.turns} for game in match.games]
+    result = {"one": name_one, "two": name_two, "seed": seed, "score": match.score, "games": games_out}
+    if profiler is not None:
+        result["profiled_moves"] = profiler.moves
+        result["slowest_moves"] = profiler.slowest_moves()
+    return result
+
+
+class PairStats:
+    # game results of bot a against bot b, a double win counts as a draw
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.match_wins = 0
+        self.match_draws = 0
+        self.match_losses = 0
+        self.reasons = {}
+
+    def add(self, result):
+        a_coin = 1 if result["one"] == self.a else 2
+        for game in result["games"]:
+            winners = game["winners"]
+            if len(winners) != 1:
+                self.draws += 1
+            elif winners[0] == a_coin:
+                self.wins += 1
+            else:
+                self.losses += 1
+            self.reasons[game["reason"]] = self.reasons.get(game["reason"], 0) + 1
+        a_score, b_score = result["score"] if a_coin == 1 else result["score"][::-1]
+        if a_score > b_score:
+            self.match_wins += 1
+        elif a_score < b_score:
+            self.match_losses += 1
+        else:
+            self.match_draws += 1
+
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def score(self):
+        return (self.wins + self.draws / 2) / self.games() if self.games() else 0.5
+
+    def variance(self):
+        games = self.games()
+        if not games:
+            return 0.0
+        mean = self.score()
+        return (self.wins * (1 - mean) ** 2 + self.draws * (0.5 - mean) ** 2 + self.losses * mean ** 2) / games
+
+    def elo(self):
+        # elo difference with a 95% interval from the per game standard error
+        games = self.games()
+        score = self.score()
+        if not games:
+            return 0.0, 0.0
+        margin = 1.96 * math.sqrt(self.variance() / games)
+        return _elo(score), (_elo(min(score + margin, 1 - 1e-9)) - _elo(max(score - margin, 1e-9))) / 2
+
+    def llr(self, elo0, elo1):
+        # normal approximation of the sequential probability ratio test on the game score
+        games = self.games()
+        variance = self.variance()
+        if not games or variance == 0:
+            return 0.0
+        score0 = _expected_score(elo0)
+        score1 = _expected_score(elo1)
+        return games * (score1 - score0) * (2 * self.score() - score0 - score1) / (2 * variance)
+
+    def as_dict(self):
+        elo, margin = self.elo()
+        return {
+            "a": self.a, "b": self.b, "games": self.games(),
+            "wins": self.wins, "draws": self.draws, "losses": self.losses,
+            "matches": [self.match_wins, self.match_draws, self.match_losses],
+            "score": round(self.score(), 4), "elo": round(elo, 1), "elo_margin": round(margin, 1),
+            "reasons": self.reasons,
+        }
+
+
+def _expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def _elo(score):
+    score = min(max(score, 1e-9), 1 - 1e-9)
+    return -400 * math.log10(1 / score - 1)
+
+
+def sprt_bounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def schedule(bots, matches, seed):
+    # every pair plays matches matches, the seat (player one) changes every match
+    for a, b in itertools.combinations(bots, 2):
+        for index in range(matches):
+            one, two = (a, b) if index % 2 == 0 else (b, a)
+            yield one, two, seed + index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless matches between bots of Bots/aiFactory.py")
+    parser.add_argument("bots", nargs="+", choices=sorted(ai_bots), help="two or more bot names, every pair plays")
+    parser.add_argument("--matches", type=int, default=100, help="matches per pair")
+    parser.add_argument("--games", type=int, default=GAMES_PER_MATCH, help="games per match")
+    parser.add_argument("--sudden-death", action="store_true", help="play on until a tied match has a leader")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the first match, match i uses seed + i")
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1)
+    parser.add_argument("--timeout-ms", type=float, default=MOVE_TIMEOUT_MS,
+                        help="forfeit moves slower than this, 0 disables")
+    parser.add_argument("--move-ms", type=float, default=0,
+                        help="think time per move for bots with a time manager (default: their own)")
+    parser.add_argument("--sprt", nargs=2, type=float, metavar=("ELO0", "ELO1"),
+                        help="stop once the SPRT for the first pair accepts H0 (elo0) or H1 (elo1)")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="run every move under cProfile and write the slowest ones to this directory")
+    parser.add_argument("--profile-top", type=int, default=DEFAULT_TOP, help="slowest moves kept by --profile")
+    args = parser.parse_args(argv)
+    if len(args.bots) < 2:
+        parser.error("at least two bots are needed")
+
+    timeout_ms = args.timeout_ms or None
+    pairs = {pair: PairStats(*pair) for pair in itertools.combinations(args.bots, 2)}
+    first_pair = next(iter(pairs.values()))
+    lower, upper = sprt_bounds(args.alpha, args.beta)
+    sprt_result = None
+    started_at = perf_counter()
+    jobs = schedule(args.bots, args.matches, args.seed)
+    profile_top = args.profile_top if args.profile else 0
+    profiler = MoveProfiler(args.profile_top)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # keep only a few matches per worker queued so an early SPRT stop does not wait long
+        running = set()
+        for job in itertools.islice(jobs, args.workers * 2):
+            running.add(pool.submit(run_match, *job, args.games, args.sudden_death, timeout_ms, args.move_ms,
+                                    profile_top))
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                key = (result["one"], result["two"]) if (result["one"], result["two"]) in pairs \
+                    else (result["two"], result["one"])
+                pairs[key].add(result)
+                profiler.moves += result.pop("profiled_moves", 0)
+                for slow_move in result.pop("slowest_moves", ()):
+                    profiler.add(slow_move)
+            if args.sprt and sprt_result is None:
+                llr = first_pair.llr(*args.sprt)
+                if llr <= lower:
+                    sprt_result = "H0"
+                elif llr >= upper:
+                    sprt_result = "H1"
+                if sprt_result:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    break
+            for job in itertools.islice(jobs, len(done)):
+                running.add(pool.submit(run_match, *job, args.games, args.sudden_death, timeout_ms, args.move_ms,
+                                    profile_top))
+            games = sum(stats.games() for stats in pairs.values())
+            print(f"\r{games} games, {games / (perf_counter() - started_at):.1f} games/s", end="", file=sys.stderr)
+    print(file=sys.stderr)
+
+    report = {"seed": args.seed, "games_per_match": args.games, "pairs": [stats.as_dict() for stats in pairs.values()]}
+    for stats in pairs.values():
+        elo, margin = stats.elo()
+        print(f"{stats.a} vs {stats.b}: +{stats.wins} ={stats.draws} -{stats.losses} "
+              f"score {stats.score():.3f} elo {elo:+.1f} +/- {margin:.1f} "
+              f"matches +{stats.match_wins} ={stats.match_draws} -{stats.match_losses} {stats.reasons}")
+    if args.sprt:
+        llr = first_pair.llr(*args.sprt)
+        report["sprt"] = {"elo0": args.sprt[0], "elo1": args.sprt[1], "llr": round(llr, 3),
+                          "bounds": [round(lower, 3), round(upper, 3)], "result": sprt_result or "continue"}
+        print(f"SPRT [{args.sprt[0]}, {args.sprt[1]}]: llr {llr:.2f} ({lower:.2f}, {upper:.2f}) "
+              f"-> {sprt_result or 'no decision yet'}")
+    if args.profile:
+        profiler.dump(args.profile)
+        profiler.print_summary(args.profile)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+
+from Bots.aiFactory import ai_bots, ai_factory
+from Bots.bitboard import HEIGHT, WIDTH, Position
+from Bots.data import PlayState
+from Bots.endgame import endgame_ready
+from Bots.opening_book import MAX_BOOK_ROUND
+from Bots.simulator import Game, set_move_time
+from Bots.time_manager import MOVE_TIMEOUT_MS
+from instrumentation import percentile
+
+CORPUS = Path(__file__).parent / "benchmarks" / "positions.json"
+# run in a fresh interpreter per measurement: the time to import the factory, create the bot
+# and answer the first move of a game, like bot.py at the start of a match. prints json.
+STARTUP_PROBE = """
+import contextlib, io, json, sys
+from time import perf_counter
+started_at = perf_counter()
+from Bots.aiFactory import ai_factory
+from Bots.bitboard import Position
+from Bots.data import PlayState
+imported_at = perf_counter()
+bot = ai_factory(sys.argv[1])
+created_at = perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    bot.start_clock(created_at)
+    bot.play(PlayState(bot.get_name(), 1, 1, (), Position([0, 0, 0])))
+moved_at = perf_counter()
+bot.stop_pondering()
+print(json.dumps({"import_ms": (imported_at - started_at) * 1000, "create_ms": (created_at - imported_at) * 1000,
+                  "first_move_ms": (moved_at - created_at) * 1000, "total_ms": (moved_at - started_at) * 1000}))
+"""
+CATEGORIES = ("opening", "midgame", "pre_explosion", "post_explosion", "near_full")
+POSITIONS_PER_CATEGORY = 6
+
+
+def load_corpus(path=CORPUS):
+    with open(path) as file:
+        return json.load(file)["positions"]
+
+
+def category_of(state, exploded_before):
+    position = state.position
+    # a position with a win on the board is answered without a search, it measures nothing
+    if position.winning_moves(1) or position.winning_moves(2):
+        return None
+    # every category has to reach the iterative deepening: book positions (up to MAX_BOOK_ROUND)
+    # and positions the endgame solver takes are answered in well under a millisecond
+    if state.round <= MAX_BOOK_ROUND or endgame_ready(position, state.bombs, state.round):
+        return None
+    empty = WIDTH * HEIGHT - position.count()
+    if state.round <= 10 and not state.bombs:
+        return "opening"
+    if exploded_before:
+        return "post_explosion"
+    if state.bombs and state.bombs[0]["explode_in_round"] - state.round <= 2:
+        return "pre_explosion"
+    if empty <= 16:
+        return "near_full"
+    if 11 <= state.round <= 24 and not state.bombs:
+        return "midgame"
+    return None
+
+
+def generate_corpus(path=CORPUS, seed=1, per_category=POSITIONS_PER_CATEGORY):
+    # self play of a fast StayinAlignAI with some random moves, positions are sorted into the
+    # categories until each one is full
+    rng = random.Random(seed)
+    random.seed(seed)
+    bot = ai_factory("StayinAlignAI")
+    set_move_time(bot, 20)
+    found = {category: [] for category in CATEGORIES}
+    game_index = 0
+    while any(len(positions) < per_category for positions in found.values()) and game_index < 500:
+        game = Game(1 + game_index % 2, random.Random(rng.getrandbits(32)))
+        game_index += 1
+        exploded_before = False
+        while not game.over():
+            state = game.play_state(bot.get_name())
+            category = category_of(state, exploded_before)
+            if category and len(found[category]) < per_category and rng.random() < 0.3:
+                found[category].append({"category": category, "game": game_index, "bot": state.bot,
+                                        "coin_id": state.coin_id, "round": state.round,
+                                        "bombs": list(state.bombs), "board": state.board})
+            moves = state.position.legal_columns()
+            # on a full board the bot answers and loses by an illegal column, like in play_game
+            column = rng.choice(moves) if moves and rng.random() < 0.2 else bot.play(state)
+            bomb_before = game.bomb
+            game.play(column)
+            exploded_before = bomb_before is not None and game.bomb is not bomb_before
+    positions = [position for category in CATEGORIES for position in found[category]]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"seed": seed, "positions": positions}, file, indent=1)
+    return positions
+
+
+def measure(bot_name, positions, repeat, move_ms):
+    # every measurement uses a fresh bot, a warm transposition table from a repeated position
+    # would hide the real cost of a move
+    latencies = []
+    per_category = {}
+    nodes = 0
+    search_seconds = 0.0
+    for entry in positions:
+        for _ in range(repeat):
+            bot = ai_factory(bot_name)
+            set_move_time(bot, move_ms)
+            state = PlayState(bot.get_name(), entry["coin_id"], entry["round"], tuple(entry["bombs"]),
+                              Position.from_board(entry["board"]))
+            with contextlib.redirect_stdout(io.StringIO()):
+                started_at = perf_counter()
+                bot.start_clock(started_at)
+                bot.play(state)
+                elapsed = perf_counter() - started_at
+            bot.stop_pondering()
+            latencies.append(elapsed * 1000)
+            per_category.setdefault(entry["category"], []).append(elapsed * 1000)
+            info = getattr(bot, "search_info", None) or {}
+            if info.get("nodes"):
+                nodes += info["nodes"]
+                search_seconds += info.get("time_ms", elapsed * 1000) / 1000
+    return {
+        "moves": len(latencies),
+        **summarize(latencies),
+        "nodes": nodes,
+        "nps": round(nodes / search_seconds) if search_seconds else None,
+        "categories": {category: summarize(values) for category, values in per_category.items()},
+    }
+
+
+def measure_startup(bot_name, repeat):
+    # medians over repeat fresh interpreters, the interpreter start itself is not counted
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", STARTUP_PROBE, bot_name], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, check=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {metric: round(percentile(sorted(run[metric] for run in runs), 50), 3) for metric in runs[0]}
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(values[-1], 3) if values else 0.0,
+        "over_timeout": sum(1 for value in values if value > MOVE_TIMEOUT_MS),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base_path, new_path, threshold):
+    # prints the change per bot, returns False if a tail latency got worse than threshold percent
+    # or a move went over the server timeout
+    with open(base_path) as file:
+        base = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    ok = True
+    print(f"{base.get('revision')} -> {new.get('revision')}")
+    for bot_name, result in new["bots"].items():
+        before = base["bots"].get(bot_name)
+        if before is None:
+            print(f"{bot_name}: no baseline")
+            continue
+        parts = []
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "max_ms", "nps"):
+            old_value, new_value = before.get(metric), result.get(metric)
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            parts.append(f"{metric} {old_value} -> {new_value} ({change:+.1f}%)")
+            if metric in ("p95_ms", "p99_ms") and change > threshold:
+                ok = False
+        if result.get("over_timeout"):
+            ok = False
+            parts.append(f"{result['over_timeout']} moves over {MOVE_TIMEOUT_MS} ms")
+        print(f"{bot_name}: " + ", ".join(parts))
+    # startup is only reported, a few runs of a fresh interpreter are too noisy to gate on
+    for bot_name, result in new.get("startup", {}).items():
+        before = base.get("startup", {}).get(bot_name)
+        if before and before.get("total_ms"):
+            change = (result["total_ms"] - before["total_ms"]) / before["total_ms"] * 100
+            print(f"{bot_name} startup: total_ms {before['total_ms']} -> {result['total_ms']} ({change:+.1f}%)")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move latency of every bot on a fixed position corpus")
+    parser.add_argument("--bots", nargs="+", choices=sorted(ai_bots), default=sorted(ai_bots))
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--repeat", type=int, default=3, help="measurements per position and bot")
+    parser.add_argument("--move-ms", type=float, default=0,
+                        help="think time for bots with a time manager (default: their own)")
+    parser.add_argument("--output", help="write the machine readable result to this file")
+    parser.add_argument("--generate", action="store_true", help="rebuild the corpus from seeded self play")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files")
+    parser.add_argument("--startup", action="store_true",
+                        help="only measure the startup (import, bot creation, first move) in fresh interpreters")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed p95/p99 regression in percent")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        sys.exit(0 if compare(*args.compare, args.threshold) else 1)
+    if args.generate:
+        positions = generate_corpus(args.corpus, args.seed)
+        print(f"wrote {len(positions)} positions to {args.corpus}")
+        return
+
+    report = {"revision": git_revision(), "python": platform.python_version(), "machine": platform.machine(),
+              "repeat": args.repeat, "move_ms": args.move_ms, "startup": {}, "bots": {}}
+    for bot_name in args.bots:
+        result = measure_startup(bot_name, args.repeat)
+        report["startup"][bot_name] = result
+        print(f"{bot_name} startup: import {result['import_ms']:.1f} ms, create {result['create_ms']:.1f} ms, "
+              f"first move {result['first_move_ms']:.1f} ms, total {result['total_ms']:.1f} ms")
+    positions = [] if args.startup else load_corpus(args.corpus)
+    report["positions"] = len(positions)
+    for bot_name in [] if args.startup else args.bots:
+        result = measure(bot_name, positions, args.repeat, args.move_ms)
+        report["bots"][bot_name] = result
+        print(f"{bot_name}: p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+              f"p99 {result['p99_ms']:.1f} ms, max {result['max_ms']:.1f} ms, nps {result['nps']}, "
+              f"{result['over_timeout']} over {MOVE_TIMEOUT_MS} ms")
+        for category, summary in result["categories"].items():
+            print(f"  {category:15} p50 {summary['p50_ms']:7.1f}  p95 {summary['p95_ms']:7.1f}  "
+                  f"max {summary['max_ms']:7.1f}")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
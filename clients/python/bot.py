@@ -1,47 +1,133 @@
+import argparse
 import asyncio
 import json
-import sys
+from time import perf_counter
 
 import websockets
 
-from Bots.aiFactory import ai_factory
-from Bots.data import PlayState
+from Bots.aiFactory import ai_bots, ai_factory
+from Bots.bitboard import WIDTH
+from Bots.data import PlayState, bot_name_of, is_ping
+from Bots.game_log import LATE, GameLog
+from Bots.helper_thread import helper_executor
+from Bots.session import GameSession, safe_column
+from Bots.time_manager import MOVE_TIMEOUT_MS
+from instrumentation import DEFAULT_WINDOW, NULL_TIMER, Instrumentation
+from profiling import DEFAULT_TOP, MoveProfiler
 
+# the event loop sends an answer this long after the state arrived, whatever the search does
+REPLY_DEADLINE_MS = MOVE_TIMEOUT_MS - 100
 
-async def handle_message(bot, websocket):
-    response_as_string = await websocket.recv()
+
+async def think(bot, state, received_at):
+    # play() runs on the helper thread while the event loop keeps the deadline and the
+    # connection (pings, close frames). past the deadline the search is told to stop and
+    # its best move so far, or a safe column worked out up front, is sent instead.
+    # returns the move and the future of the search.
+    fallback = safe_column(state.position, state.coin_id)
+    # the ponder search holds the only helper thread, it has to make room first
+    bot.stop_pondering()
+    search = asyncio.get_running_loop().run_in_executor(helper_executor(), bot.play, state)
+    timeout = max(0.0, REPLY_DEADLINE_MS / 1000 - (perf_counter() - received_at))
     try:
-        decoded_response = response_as_string.decode('utf-8').replace("'", '"')
-        response: PlayState = PlayState.from_dict(json.loads(decoded_response))
-        if response.bot == bot.get_name():
-            bot_answer = bot.play(response)
-            await websocket.send(json.dumps({"state": "play", "column": bot_answer}))
-    except UnicodeDecodeError:
+        move = await asyncio.wait_for(asyncio.shield(search), timeout)
+    except asyncio.TimeoutError:
+        bot.stop()
+        move = bot.best_move_so_far()
+        print(f"search not done after {REPLY_DEADLINE_MS} ms, sending {fallback if move is None else move}")
+    except Exception as error:
+        print(f"search failed: {error!r}")
+        move = None
+    if not isinstance(move, int) or not 0 <= move < WIDTH or not state.position.can_play(move):
+        move = fallback
+    return move, search
+
+
+async def handle_message(session, websocket, stats=None, game_log=None):
+    bot = session.bot
+    waiting_since = perf_counter()
+    frame = await websocket.recv()
+    # the move time of the server starts when it sent the message, so does ours
+    received_at = perf_counter()
+    if isinstance(frame, str):
+        frame = frame.encode("utf-8")
+    if is_ping(frame):
         print("got ping message")
+        return
+    # every state is sent to both bots, the one for the other bot is not parsed at all
+    if bot_name_of(frame) != bot.get_name().encode("utf-8"):
+        return
+    timer = stats.begin(received_at) if stats is not None else NULL_TIMER
+    timer.lap("peek")
+    response = PlayState.from_frame(frame)
+    timer.lap("parse")
+    bot.start_clock(received_at)
+    session.observe(response)
+    bot_answer, search = await think(bot, response, received_at)
+    session.record(response, bot_answer)
+    timer.lap("play")
+    await websocket.send(json.dumps({"state": "play", "column": bot_answer}))
+    timer.lap("send")
+    if game_log is not None:
+        # a search still running was cut off by the deadline
+        game_log.record(session.games, response, bot_answer, (perf_counter() - received_at) * 1000,
+                        0 if search.done() else LATE)
+    if not search.done():
+        # a stopped search unwinds before the next state or the ponder search can start
+        await asyncio.wait((search,))
+    timer.finish(bot)
+    if stats is not None:
+        stats.record_wait((received_at - waiting_since) * 1000)
+    bot.start_pondering()
 
 
-async def client(bot, port):
+async def client(bot, port, stats=None, stats_file=None, log_file=None, profiler=None, profile_dir=None):
     uri = f"ws://localhost:{port}/{bot.get_name()}"
+    session = GameSession(bot)
+    game_log = GameLog(log_file, bot.get_name()) if log_file else None
     async with websockets.connect(uri, ping_timeout=None, ping_interval=None) as websocket:
         print("Connected to server.")
-        while True:
-            try:
-                await handle_message(bot, websocket)
-            except websockets.ConnectionClosedOK:
-                print("Connection closed by server.")
-                break
-            except websockets.ConnectionClosedError:
-                print("Server was shut down.")
-                break
+        try:
+            while True:
+                try:
+                    await handle_message(session, websocket, stats, game_log)
+                except websockets.ConnectionClosedOK:
+                    print("Connection closed by server.")
+                    break
+                except websockets.ConnectionClosedError:
+                    print("Server was shut down.")
+                    break
+        finally:
+            bot.stop_pondering()
+            if game_log is not None:
+                game_log.close()
+            if profiler is not None:
+                profiler.dump(profile_dir)
+                profiler.print_summary(profile_dir)
+            if stats is not None:
+                stats.print_summary()
+                if stats_file:
+                    stats.write(stats_file)
 
 
 if __name__ == "__main__":
-    ai_bot = ai_factory()
-    used_port = 5051
-    if len(sys.argv) == 2:
-        ai_bot = ai_factory(sys.argv[1])
-    if len(sys.argv) == 3:
-        ai_bot = ai_factory(sys.argv[1])
-        used_port = sys.argv[2]
-
-    asyncio.run(client(ai_bot, used_port))
+    parser = argparse.ArgumentParser(description="Connects a bot to the FourConnectXtreme server")
+    parser.add_argument("bot", nargs="?", default="MyAI", choices=sorted(ai_bots))
+    parser.add_argument("port", nargs="?", default=5051)
+    parser.add_argument("--stats", action="store_true", help="time every phase of a move, summary at the end")
+    parser.add_argument("--stats-file", help="also write the summary as JSON to this file (implies --stats)")
+    parser.add_argument("--stats-window", type=int, default=DEFAULT_WINDOW,
+                        help="moves the percentiles are computed over")
+    parser.add_argument("--log", help="append every state and the column sent to this binary game log (replay.py)")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="run every move under cProfile and write the slowest ones to this directory")
+    parser.add_argument("--profile-top", type=int, default=DEFAULT_TOP, help="slowest moves kept by --profile")
+    args = parser.parse_args()
+
+    move_stats = Instrumentation(args.stats_window) if args.stats or args.stats_file else None
+    selected_bot = ai_factory(args.bot)
+    move_profiler = None
+    if args.profile:
+        move_profiler = MoveProfiler(args.profile_top)
+        move_profiler.attach(selected_bot)
+    asyncio.run(client(selected_bot, args.port, move_stats, args.stats_file, args.log, move_profiler, args.profile))
@@ -0,0 +1,149 @@
+import json
+from bisect import bisect_left
+from collections import deque
+from time import perf_counter
+
+from Bots.time_manager import MOVE_TIMEOUT_MS
+
+# phases of one move in bot.py, in order. "recv" is the wait for the server and not part of the move.
+PHASES = ("recv", "peek", "parse", "play", "send")
+# upper bucket edges in ms of the all time histograms
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 600, 700)
+# a move that takes longer than this share of the timeout counts as close to the deadline
+NEAR_DEADLINE = 0.8
+DEFAULT_WINDOW = 1000
+
+
+def percentile(values, percent):
+    # nearest rank percentile of a sorted list
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+class Histogram:
+    # percentiles over the last window samples plus all time bucket counts
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.recent = deque(maxlen=window)
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.recent.append(value)
+        self.buckets[bisect_left(BUCKETS_MS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def summary(self):
+        values = sorted(self.recent)
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(self.max, 3),
+            "buckets": {f"<={edge}" if edge is not None else f">{BUCKETS_MS[-1]}": count
+                        for edge, count in zip(BUCKETS_MS + (None,), self.buckets) if count},
+        }
+
+
+class PhaseTimer:
+    # timing of one message, lap() closes the phase that ran since the last lap
+    def __init__(self, instrumentation, started_at):
+        self.instrumentation = instrumentation
+        self.started_at = started_at
+        self.last = started_at
+        self.laps = {}
+
+    def lap(self, phase):
+        now = perf_counter()
+        self.laps[phase] = (now - self.last) * 1000
+        self.last = now
+
+    def finish(self, bot=None):
+        self.instrumentation.record(self.laps, (self.last - self.started_at) * 1000, bot)
+
+
+class _NullTimer:
+    # stands in for PhaseTimer when the statistics are off
+    def lap(self, phase):
+        pass
+
+    def finish(self, bot=None):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class Instrumentation:
+    def __init__(self, window=DEFAULT_WINDOW, timeout_ms=MOVE_TIMEOUT_MS):
+        self.timeout_ms = timeout_ms
+        self.phases = {phase: Histogram(window) for phase in PHASES}
+        self.move = Histogram(window)
+        self.depth = Histogram(window)
+        self.nodes = Histogram(window)
+        self.near_deadline = 0
+        self.over_deadline = 0
+        self.min_margin_ms = None
+
+    def begin(self, started_at=None):
+        return PhaseTimer(self, perf_counter() if started_at is None else started_at)
+
+    def record_wait(self, wait_ms):
+        self.phases["recv"].add(wait_ms)
+
+    def record(self, laps, move_ms, bot=None):
+        for phase, value in laps.items():
+            self.phases[phase].add(value)
+        self.move.add(move_ms)
+        margin = self.timeout_ms - move_ms
+        if self.min_margin_ms is None or margin < self.min_margin_ms:
+            self.min_margin_ms = margin
+        if move_ms > self.timeout_ms:
+            self.over_deadline += 1
+        elif move_ms > self.timeout_ms * NEAR_DEADLINE:
+            self.near_deadline += 1
+        search = bot.report_search() if bot is not None else None
+        if search:
+            if search.get("depth") is not None:
+                self.depth.add(search["depth"])
+            if search.get("nodes") is not None:
+                self.nodes.add(search["nodes"])
+
+    def summary(self):
+        return {
+            "moves": self.move.count,
+            "timeout_ms": self.timeout_ms,
+            "min_margin_ms": round(self.min_margin_ms, 3) if self.min_margin_ms is not None else None,
+            "near_deadline": self.near_deadline,
+            "over_deadline": self.over_deadline,
+            "move_ms": self.move.summary(),
+            "phases_ms": {phase: histogram.summary() for phase, histogram in self.phases.items() if histogram.count},
+            "search_depth": self.depth.summary() if self.depth.count else None,
+            "search_nodes": self.nodes.summary() if self.nodes.count else None,
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"{summary['moves']} moves, {summary['over_deadline']} over {self.timeout_ms} ms, "
+              f"{summary['near_deadline']} over {self.timeout_ms * NEAR_DEADLINE:.0f} ms, "
+              f"smallest margin {summary['min_margin_ms']} ms")
+        rows = [("move", summary["move_ms"])] + list(summary["phases_ms"].items())
+        for name, values in rows:
+            print(f"  {name:10} p50 {values['p50']:8.2f}  p95 {values['p95']:8.2f}  "
+                  f"p99 {values['p99']:8.2f}  max {values['max']:8.2f} ms")
+        for name in ("search_depth", "search_nodes"):
+            if summary[name]:
+                print(f"  {name:13} mean {summary[name]['mean']:.1f}  p50 {summary[name]['p50']}  "
+                      f"max {summary[name]['max']}")
+
+    def write(self, path):
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=2)
@@ -0,0 +1,91 @@
+import argparse
+import contextlib
+import io
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from time import perf_counter
+
+from Bots.bitboard import WIDTH, Position
+from Bots.data import PlayState
+from Bots.opening_book import BOOK_PATH, MAX_BOOK_ROUND, book_key, write_book
+from Bots.stayinalign_ai import StayinAlignAI
+
+# the contest limit for code plus configuration
+MAX_BOOK_BYTES = 2 * 1024 * 1024
+
+
+def search_position(stones_one, stones_two, current_round, seconds):
+    # worker: the book move of coin 1 from a long search without the time limit of the server
+    bot = StayinAlignAI(timeout_ms=seconds * 1000, safety_margin_ms=0, ponder=False, opening_book=None)
+    state = PlayState("book", 1, current_round, (), Position([0, stones_one, stones_two]))
+    with contextlib.redirect_stdout(io.StringIO()):
+        move = bot.play(state)
+    info = bot.search_info
+    return move, info.get("depth", 0), info.get("score") or 0
+
+
+def replies(position, move, current_round, max_round):
+    # positions after our book move and every reply of the opponent, we (coin 1) move again
+    if current_round + 2 > max_round or position.is_winning_move(move, 1):
+        return
+    after = position.copy()
+    after.play(move, 1)
+    for reply in after.legal_columns():
+        if after.is_winning_move(reply, 2):
+            continue
+        position_after = after.copy()
+        position_after.play(reply, 2)
+        yield position_after, current_round + 2
+
+
+def build(max_round, seconds, workers):
+    # the book covers the positions reachable when we play book moves: rounds 1, 3, 5 if we
+    # start, rounds 2, 4, 6 if the opponent starts. we are always coin 1 here, book_key
+    # handles coin 2 and mirror images.
+    entries = {}
+    empty = Position()
+    frontier = {book_key(empty, 1)[0]: (empty, 1)}
+    for first in range(WIDTH):
+        position = empty.copy()
+        position.play(first, 2)
+        frontier.setdefault(book_key(position, 1)[0], (position, 2))
+    frontier = {key: job for key, job in frontier.items() if job[1] <= max_round}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while frontier:
+            started_at = perf_counter()
+            jobs = list(frontier.items())
+            futures = [pool.submit(search_position, position.stones[1], position.stones[2], current_round, seconds)
+                       for _, (position, current_round) in jobs]
+            next_frontier = {}
+            for (key, (position, current_round)), future in zip(jobs, futures):
+                move, depth, score = future.result()
+                mirrored = book_key(position, 1)[1]
+                entries[key] = (WIDTH - 1 - move if mirrored else move, depth, score)
+                for position_after, round_after in replies(position, move, current_round, max_round):
+                    key_after = book_key(position_after, 1)[0]
+                    if key_after not in entries:
+                        next_frontier.setdefault(key_after, (position_after, round_after))
+            print(f"{len(jobs)} positions in {perf_counter() - started_at:.0f} s, {len(entries)} in the book")
+            frontier = next_frontier
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Searches the opening positions and writes the opening book")
+    parser.add_argument("--max-round", type=int, default=MAX_BOOK_ROUND, choices=range(1, MAX_BOOK_ROUND + 1),
+                        help="last round in the book")
+    parser.add_argument("--seconds", type=float, default=3.0, help="search time per position")
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1)
+    parser.add_argument("--output", default=BOOK_PATH)
+    args = parser.parse_args(argv)
+
+    entries = build(args.max_round, args.seconds, args.workers)
+    size = write_book(args.output, entries)
+    if size > MAX_BOOK_BYTES:
+        raise SystemExit(f"{args.output} has {size} bytes, more than the {MAX_BOOK_BYTES} bytes allowed")
+    print(f"wrote {len(entries)} positions ({size} bytes) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import os
+
+from Bots.bitboard import TABLE_LAYOUT, TABLES_PATH, TABLES_SIGNATURE, compute_tables
+from Bots.opening_book import BOOK_PATH
+from Bots.table_cache import load_tables, write_tables
+from make_book import MAX_BOOK_BYTES
+
+# writes the precomputed tables of bitboard.py to Bots/tables.bin. run it again after a change
+# of the tables, the board size or the zobrist seed: until then bitboard.py ignores the old
+# file and computes the tables at every start.
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Writes the precomputed bitboard tables")
+    parser.add_argument("--output", default=TABLES_PATH)
+    args = parser.parse_args(argv)
+
+    tables = compute_tables()
+    size = write_tables(args.output, TABLE_LAYOUT, TABLES_SIGNATURE, tables)
+    loaded = load_tables(args.output, TABLE_LAYOUT, TABLES_SIGNATURE)
+    if loaded is None or any(list(loaded[name]) != tables[name] for name, _, _ in TABLE_LAYOUT):
+        raise SystemExit(f"{args.output} does not read back as written")
+    # the tables and the opening book share the size limit of a submission
+    book_size = os.path.getsize(BOOK_PATH) if os.path.exists(BOOK_PATH) else 0
+    if size + book_size > MAX_BOOK_BYTES:
+        raise SystemExit(f"{args.output} and the book have {size + book_size} bytes, "
+                         f"more than the {MAX_BOOK_BYTES} bytes allowed")
+    print(f"wrote {len(TABLE_LAYOUT)} tables ({size} bytes) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+import argparse
+import json
+import random
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+from Bots.bitboard import BOMB_ID, HEIGHT, WIDTH, Position
+from Bots.simulator import BOOM_IN, Game
+from Bots.stayinalign_ai import StayinAlignAI
+
+# perft for the rules: counts every line of play from fixed start positions down to a depth,
+# with the bomb drops of the schedule as a branch per free column and the explosions in
+# their round. an engine is one implementation of the rules:
+#   bitboard   Bots/bitboard.py Position, what the simulator and the search use
+#   board_gd   a line by line port of game/scenes/game/board.gd and game.gd _detonate
+#   bot        the helpers of StayinAlignAI (find_possible_moves, find_winning_moves, simulate_bomb)
+# the counts of the bitboard engine are kept in benchmarks/perft.json. --diff walks two engines
+# side by side and stops at the first position where they disagree.
+GOLDEN = Path(__file__).parent / "benchmarks" / "perft.json"
+START_POSITIONS = 8
+DEFAULT_DEPTH = 4
+
+
+class BitboardEngine:
+    def __init__(self, board):
+        self.position = Position.from_board(board)
+
+    def legal_columns(self):
+        return self.position.legal_columns()
+
+    def play(self, col, coin_id):
+        # returns whether the move won
+        self.position.play(col, coin_id)
+        return self.position.has_won(coin_id)
+
+    def undo(self, col, coin_id):
+        self.position.undo(col, coin_id)
+
+    def drop_bomb(self, col):
+        row = self.position.heights[col]
+        self.position.drop_bomb(col)
+        return row
+
+    def lift_bomb(self, col):
+        self.position.lift_bomb(col)
+
+    def explode(self, row, col):
+        # returns the winners and what restore() needs. like game.gd, a bomb without coins
+        # around it skips the winner scan
+        occupied = self.position.occupied
+        saved = self.position.explode(row, col)
+        if self.position.count() == occupied.bit_count() - 1:
+            return [], saved
+        return self.position.winners(), saved
+
+    def restore(self, saved):
+        self.position.restore(saved)
+
+    def board(self):
+        return self.position.to_board()
+
+
+class BoardGdEngine:
+    # board[row][col] with row 0 at the bottom, the functions keep the names of board.gd
+    def __init__(self, board):
+        self.cells = [list(row) for row in board]
+        self.last_insert = (0, 0)
+
+    def get_free_row(self, column):
+        for row in range(HEIGHT):
+            if self.cells[row][column] == 0:
+                return row
+        return -1
+
+    def insert(self, player_id, column):
+        free_row = self.get_free_row(column)
+        if free_row != -1:
+            self.cells[free_row][column] = player_id
+            self.last_insert = (column, free_row)
+        return free_row
+
+    def _count_in_direction(self, row, col, direction, player_id):
+        # direction is (x, y) = (col, row) like the Vector2 of board.gd
+        count = []
+        row += direction[1]
+        col += direction[0]
+        while 0 <= col < WIDTH and 0 <= row < HEIGHT:
+            if self.cells[row][col] != player_id:
+                return count
+            count.append((row, col))
+            row += direction[1]
+            col += direction[0]
+        return count
+
+    def _streak(self, row, col, player_id):
+        for direction in ((1, 0), (0, -1), (1, 1), (1, -1)):
+            opposite = (-direction[0], -direction[1])
+            coins = [(row, col)] + self._count_in_direction(row, col, direction, player_id) \
+                + self._count_in_direction(row, col, opposite, player_id)
+            if len(coins) >= 4:
+                return True
+        return False
+
+    def is_winner(self, player_id):
+        col, row = self.last_insert
+        return self._streak(row, col, player_id)
+
+    def detect_winner_full_scan(self):
+        winners = []
+        for row in range(HEIGHT):
+            for col in range(WIDTH):
+                player_id = self.cells[row][col]
+                if player_id != 0 and player_id != BOMB_ID and player_id not in winners:
+                    if self._streak(row, col, player_id):
+                        winners.append(player_id)
+        return winners
+
+    def _apply_gravity(self):
+        for col in range(WIDTH):
+            column = [self.cells[row][col] for row in range(HEIGHT) if self.cells[row][col] != 0]
+            column += [0] * (HEIGHT - len(column))
+            for row in range(HEIGHT):
+                self.cells[row][col] = column[row]
+
+    def update_after_detonation(self, detonation_row, detonation_col):
+        exploding_coins = []
+        self.cells[detonation_row][detonation_col] = 0
+        for row, col in ((detonation_row, detonation_col - 1), (detonation_row, detonation_col + 1),
+                         (detonation_row + 1, detonation_col), (detonation_row - 1, detonation_col)):
+            if 0 <= col < WIDTH and 0 <= row < HEIGHT and self.cells[row][col] != 0:
+                exploding_coins.append((row, col))
+                self.cells[row][col] = 0
+        self._apply_gravity()
+        return exploding_coins
+
+    def legal_columns(self):
+        return [col for col in range(WIDTH) if self.get_free_row(col) != -1]
+
+    def play(self, col, coin_id):
+        self.insert(coin_id, col)
+        return self.is_winner(coin_id)
+
+    def undo(self, col, coin_id):
+        # the top cell of the column
+        free_row = self.get_free_row(col)
+        self.cells[(free_row if free_row != -1 else HEIGHT) - 1][col] = 0
+
+    def drop_bomb(self, col):
+        return self.insert(BOMB_ID, col)
+
+    def lift_bomb(self, col):
+        self.undo(col, BOMB_ID)
+
+    def explode(self, row, col):
+        # game.gd _detonate: no coin in the blast, no winner scan
+        saved = [cells[:] for cells in self.cells]
+        if not self.update_after_detonation(row, col):
+            return [], saved
+        return self.detect_winner_full_scan(), saved
+
+    def restore(self, saved):
+        self.cells = saved
+
+    def board(self):
+        return [row[:] for row in self.cells]
+
+
+class BotEngine:
+    # the rule helpers StayinAlignAI plays with
+    bot = None
+
+    def __init__(self, board):
+        if BotEngine.bot is None:
+            BotEngine.bot = StayinAlignAI(tt_size_mb=1, ponder=False, opening_book=None)
+        self.position = Position.from_board(board)
+
+    def legal_columns(self):
+        return self.bot.find_possible_moves(self.position)
+
+    def play(self, col, coin_id):
+        won = col in self.bot.find_winning_moves(self.position, coin_id, self.legal_columns())
+        self.position.play(col, coin_id)
+        return won
+
+    def undo(self, col, coin_id):
+        self.position.undo(col, coin_id)
+
+    def drop_bomb(self, col):
+        row = self.position.heights[col]
+        self.position.drop_bomb(col)
+        return row
+
+    def lift_bomb(self, col):
+        self.position.lift_bomb(col)
+
+    def explode(self, row, col):
+        saved = self.position
+        self.position = self.bot.simulate_bomb(saved, [{"row": row, "col": col}])
+        return self.position.winners(), saved
+
+    def restore(self, saved):
+        self.position = saved
+
+    def board(self):
+        return self.position.to_board()
+
+
+ENGINES = {"bitboard": BitboardEngine, "board_gd": BoardGdEngine, "bot": BotEngine}
+
+
+class Mismatch(Exception):
+    pass
+
+
+class DiffEngine:
+    # runs two engines side by side, every answer and the board after every change must agree
+    def __init__(self, one, two):
+        self.one = one
+        self.two = two
+        self.path = []
+
+    def _same(self, what, first, second):
+        if first != second or self.one.board() != self.two.board():
+            raise Mismatch(f"{what} after {' '.join(self.path) or 'the start'}: {first} != {second}\n"
+                           f"{self.one.board()[::-1]}\n{self.two.board()[::-1]}")
+        return first
+
+    def legal_columns(self):
+        return self._same("legal columns", self.one.legal_columns(), self.two.legal_columns())
+
+    def play(self, col, coin_id):
+        self.path.append(f"{coin_id}:{col}")
+        return self._same(f"win of {coin_id}:{col}", self.one.play(col, coin_id), self.two.play(col, coin_id))
+
+    def undo(self, col, coin_id):
+        self.one.undo(col, coin_id)
+        self.two.undo(col, coin_id)
+        self.path.pop()
+        self._same("undo", None, None)
+
+    def drop_bomb(self, col):
+        self.path.append(f"bomb:{col}")
+        return self._same(f"bomb row in {col}", self.one.drop_bomb(col), self.two.drop_bomb(col))
+
+    def lift_bomb(self, col):
+        self.one.lift_bomb(col)
+        self.two.lift_bomb(col)
+        self.path.pop()
+        self._same("lift bomb", None, None)
+
+    def explode(self, row, col):
+        self.path.append(f"boom:{row},{col}")
+        winners_one, saved_one = self.one.explode(row, col)
+        winners_two, saved_two = self.two.explode(row, col)
+        self._same(f"winners of the explosion at {row},{col}", sorted(winners_one), sorted(winners_two))
+        return winners_one, (saved_one, saved_two)
+
+    def restore(self, saved):
+        self.one.restore(saved[0])
+        self.two.restore(saved[1])
+        self.path.pop()
+        self._same("restore", None, None)
+
+
+@dataclass
+class Start:
+    # a position of a running game and the rest of its bomb schedule
+    board: List[List[int]]
+    to_move: int
+    turn: int
+    bomb: Optional[Tuple[int, int, int]]
+    drop_turns: Tuple[int, ...]
+
+
+@dataclass
+class Counts:
+    leaves: int = 0
+    moves: int = 0
+    wins: int = 0
+    drops: int = 0
+    explosions: int = 0
+    explosion_wins: int = 0
+    full_boards: int = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def perft(engine, to_move, turn, bomb, drop_turns, depth, counts: Counts):
+    # the lines of depth moves from the position of engine, to_move plays turn
+    if depth == 0:
+        counts.leaves += 1
+        return
+    moves = engine.legal_columns()
+    if not moves:
+        # game.gd: the column is full, the mover loses
+        counts.full_boards += 1
+        return
+    for col in moves:
+        counts.moves += 1
+        if engine.play(col, to_move):
+            counts.wins += 1
+        else:
+            next_turn(engine, 3 - to_move, turn + 1, bomb, drop_turns, depth - 1, counts)
+        engine.undo(col, to_move)
+
+
+def next_turn(engine, to_move, turn, bomb, drop_turns, depth, counts: Counts):
+    # simulator.Game._next: a scheduled bomb drops into any free column, else a due bomb explodes
+    if turn in drop_turns:
+        columns = engine.legal_columns()
+        for col in columns:
+            counts.drops += 1
+            row = engine.drop_bomb(col)
+            perft(engine, to_move, turn, (row, col, turn + BOOM_IN), drop_turns, depth, counts)
+            engine.lift_bomb(col)
+        if not columns:
+            perft(engine, to_move, turn, bomb, drop_turns, depth, counts)
+        return
+    if bomb is not None and turn >= bomb[2]:
+        counts.explosions += 1
+        winners, saved = engine.explode(bomb[0], bomb[1])
+        if winners:
+            counts.explosion_wins += 1
+        else:
+            perft(engine, to_move, turn, None, drop_turns, depth, counts)
+        engine.restore(saved)
+        return
+    perft(engine, to_move, turn, bomb, drop_turns, depth, counts)
+
+
+def start_positions(seed=1, count=START_POSITIONS):
+    # random games of the simulator stopped at a spread of turns, half of them close to a bomb
+    rng = random.Random(seed)
+    starts = []
+    while len(starts) < count:
+        game = Game(1 + len(starts) % 2, random.Random(rng.getrandbits(32)))
+        stop_turn = rng.choice((game.bomb_drop_turns[0] - 1, game.bomb_drop_turns[0] + 2, rng.randint(1, 24)))
+        while not game.over() and game.current_turn < stop_turn:
+            moves = [col for col in game.position.legal_columns()
+                     if not game.position.is_winning_move(col, game.to_move)]
+            if not moves:
+                break
+            game.play(rng.choice(moves))
+        if game.over() or game.current_turn != stop_turn:
+            continue
+        bomb = (game.bomb.row, game.bomb.col, game.bomb.boom_in_round) \
+            if game.bomb is not None and game.bomb.boom_in_round > game.current_turn else None
+        starts.append(Start(game.position.to_board(), game.to_move, game.current_turn, bomb,
+                            tuple(game.bomb_drop_turns)))
+    return starts
+
+
+def run(engine_name, start: Start, depth, other=None):
+    engine = ENGINES[engine_name](start.board)
+    if other is not None:
+        engine = DiffEngine(engine, ENGINES[other](start.board))
+    counts = Counts()
+    started_at = perf_counter()
+    perft(engine, start.to_move, start.turn, start.bomb, start.drop_turns, depth, counts)
+    return counts, perf_counter() - started_at
+
+
+def load_golden(path=GOLDEN):
+    with open(path) as file:
+        data = json.load(file)
+    starts = [Start(entry["board"], entry["to_move"], entry["turn"],
+                    tuple(entry["bomb"]) if entry["bomb"] else None, tuple(entry["drop_turns"]))
+              for entry in data["positions"]]
+    return data, starts
+
+
+def generate(path, seed, count, depth):
+    entries = []
+    for start in start_positions(seed, count):
+        counts, _ = run("bitboard", start, depth)
+        entries.append({**start.__dict__, "depth": depth, "counts": counts.as_dict()})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"seed": seed, "positions": entries}, file, indent=1)
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft and rules parity checks of the engines")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="bitboard")
+    parser.add_argument("--diff", choices=sorted(ENGINES), metavar="ENGINE",
+                        help="walk this engine next to --engine and stop at the first difference")
+    parser.add_argument("--depth", type=int, help="depth instead of the golden one, skips the golden check")
+    parser.add_argument("--golden", type=Path, default=GOLDEN)
+    parser.add_argument("--generate", action="store_true", help="write new golden counts with the bitboard engine")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--positions", type=int, default=START_POSITIONS)
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        entries = generate(args.golden, args.seed, args.positions, args.depth or DEFAULT_DEPTH)
+        print(f"{len(entries)} positions -> {args.golden}")
+        return
+    data, starts = load_golden(args.golden)
+    ok = True
+    total_moves = 0
+    total_seconds = 0.0
+    for index, (entry, start) in enumerate(zip(data["positions"], starts)):
+        depth = args.depth or entry["depth"]
+        try:
+            counts, seconds = run(args.engine, start, depth, args.diff)
+        except Mismatch as error:
+            print(f"position {index}: {args.engine} and {args.diff} differ, {error}")
+            ok = False
+            break
+        total_moves += counts.moves
+        total_seconds += seconds
+        expected = entry["counts"] if args.depth is None else None
+        status = "" if expected is None else ("ok" if counts.as_dict() == expected else f"expected {expected}")
+        ok = ok and status in ("", "ok")
+        print(f"position {index} turn {start.turn:2} depth {depth}: {counts.leaves:8} leaves {counts.moves:8} moves "
+              f"{counts.drops:6} drops {counts.explosions:6} explosions  "
+              f"{counts.moves / seconds if seconds else 0:10.0f} moves/s  {status}")
+    print(f"{args.engine}{' + ' + args.diff if args.diff else ''}: {total_moves} moves in {total_seconds:.2f} s, "
+          f"{total_moves / total_seconds if total_seconds else 0:.0f} moves/s")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
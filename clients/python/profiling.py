@@ -0,0 +1,169 @@
+import cProfile
+import heapq
+import itertools
+import json
+import marshal
+import os
+from time import perf_counter
+
+# profiling mode of bot.py and arena.py. attach() swaps the play() of a bot for one that runs
+# under cProfile and keeps the profiles of the slowest moves, a bot that was never attached
+# runs exactly as before. dump() writes per move:
+#   <name>.folded   collapsed stacks in microseconds (flamegraph.pl, speedscope, inferno)
+#   <name>.prof     the raw cProfile data (python -m pstats, snakeviz)
+#   <name>.json     the position, the move, search_info and the functions with the most time
+# cProfile only keeps caller -> callee pairs, not whole stacks. the folded stacks split the
+# own time of a function over its callers in proportion to the time of each call edge, a
+# function already on the stack (score -> after_move -> score) is not entered again. stacks
+# below MIN_STACK_US are dropped.
+DEFAULT_TOP = 10
+# functions listed first in the json summary
+WATCHED = ("play", "find_winning_moves", "find_double_threat_moves", "project_board", "simulate_bomb",
+           "find_good_moves", "solve_endgame", "score", "heuristic", "explosion", "spawn")
+HOT_FUNCTIONS = 25
+# stacks below this many microseconds are left out of the folded file
+MIN_STACK_US = 1
+
+
+def frame_name(func):
+    filename, line, name = func
+    if filename == "~":
+        # builtins, e.g. "<method 'bit_count' of 'int' objects>"
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def folded_stacks(stats):
+    # {stack: microseconds} from the raw stats of cProfile, stacks joined by ";"
+    children = {}
+    incoming = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, {})[func] = edge[3]
+            # with recursion the edges of a function add up to more than its total time
+            incoming[func] = incoming.get(func, 0.0) + edge[3]
+    roots = [func for func, entry in stats.items() if not entry[4]]
+    visits = []
+    reached = {}
+
+    def walk(func, path, share, seen):
+        if share * stats[func][3] * 1e6 < MIN_STACK_US:
+            return
+        path = f"{path};{frame_name(func)}" if path else frame_name(func)
+        visits.append((path, func, share))
+        reached[func] = reached.get(func, 0.0) + share
+        for child, edge_time in children.get(func, {}).items():
+            if child not in seen and incoming[child]:
+                walk(child, path, share * edge_time / incoming[child], seen | {child})
+
+    for root in roots:
+        walk(root, "", 1.0, {root})
+    # the shares of a function add up to less than 1 where a cycle was cut, scaling them back
+    # keeps the own time of every function whole
+    stacks = {}
+    for path, func, share in visits:
+        micros = round(stats[func][2] * share / reached[func] * 1e6)
+        if micros >= MIN_STACK_US:
+            stacks[path] = stacks.get(path, 0) + micros
+    return stacks
+
+
+def hot_functions(stats, count=HOT_FUNCTIONS):
+    rows = [{"function": frame_name(func), "calls": calls, "own_ms": round(own * 1000, 3),
+             "total_ms": round(total * 1000, 3)}
+            for func, (_, calls, own, total, _) in stats.items()]
+    watched = sorted((row for row in rows if row["function"].split(" ")[0] in WATCHED),
+                     key=lambda row: row["total_ms"], reverse=True)
+    by_own = sorted(rows, key=lambda row: row["own_ms"], reverse=True)[:count]
+    return {"watched": watched, "by_own_time": by_own}
+
+
+class SlowMove:
+    def __init__(self, elapsed_ms, bot, state, move, search_info, stats):
+        self.elapsed_ms = elapsed_ms
+        self.bot = bot
+        self.state = state
+        self.move = move
+        self.search_info = search_info
+        self.stats = stats
+
+    def summary(self):
+        return {
+            "elapsed_ms": round(self.elapsed_ms, 3),
+            "bot": self.bot,
+            "move": self.move,
+            "search_info": self.search_info,
+            "state": self.state,
+            "hot_functions": hot_functions(self.stats),
+        }
+
+
+class MoveProfiler:
+    # keeps the top slowest profiled moves in a min heap, the fastest of them on top
+    def __init__(self, top=DEFAULT_TOP):
+        self.top = top
+        self.slowest = []
+        self.moves = 0
+        self._order = itertools.count()
+
+    def attach(self, bot):
+        play = bot.play
+
+        def profiled_play(state):
+            return self.profile(bot, play, state)
+
+        bot.play = profiled_play
+        return bot
+
+    def profile(self, bot, play, state):
+        # bot.py stops the ponder search before every play(), the profile only holds the move
+        profile = cProfile.Profile()
+        started_at = perf_counter()
+        profile.enable()
+        try:
+            move = play(state)
+        finally:
+            profile.disable()
+        elapsed_ms = (perf_counter() - started_at) * 1000
+        self.moves += 1
+        if len(self.slowest) < self.top or elapsed_ms > self.slowest[0][0]:
+            profile.create_stats()
+            state_data = {"bot": state.bot, "coin_id": state.coin_id, "round": state.round,
+                          "bombs": list(state.bombs), "board": state.board}
+            self.add(SlowMove(elapsed_ms, bot.get_name(), state_data, move,
+                              dict(getattr(bot, "search_info", None) or {}), profile.stats))
+        return move
+
+    def add(self, slow_move: SlowMove):
+        entry = (slow_move.elapsed_ms, next(self._order), slow_move)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif slow_move.elapsed_ms > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def slowest_moves(self):
+        return [slow_move for _, _, slow_move in sorted(self.slowest, key=lambda entry: -entry[0])]
+
+    def dump(self, directory):
+        # one set of files per kept move, the slowest first. returns the summaries.
+        os.makedirs(directory, exist_ok=True)
+        summaries = []
+        for rank, slow_move in enumerate(self.slowest_moves(), start=1):
+            name = os.path.join(directory, f"move_{rank:02}_{slow_move.elapsed_ms:.0f}ms")
+            with open(name + ".folded", "w") as file:
+                for stack, micros in sorted(folded_stacks(slow_move.stats).items()):
+                    file.write(f"{stack} {micros}\n")
+            with open(name + ".prof", "wb") as file:
+                marshal.dump(slow_move.stats, file)
+            summary = slow_move.summary()
+            with open(name + ".json", "w") as file:
+                json.dump(summary, file, indent=2)
+            summaries.append(summary)
+        return summaries
+
+    def print_summary(self, directory):
+        print(f"profiled {self.moves} moves, the {len(self.slowest)} slowest are in {directory}")
+        for slow_move in self.slowest_moves():
+            watched = hot_functions(slow_move.stats)["watched"][:4]
+            parts = ", ".join(f"{row['function'].split(' ')[0]} {row['total_ms']:.1f}" for row in watched)
+            print(f"  {slow_move.elapsed_ms:8.1f} ms  round {slow_move.state['round']:2}  {parts}")
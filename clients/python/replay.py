@@ -0,0 +1,152 @@
+import argparse
+import contextlib
+import io
+import json
+from time import perf_counter
+
+from Bots.aiFactory import ai_bots, ai_factory
+from Bots.game_log import read_log
+from Bots.simulator import set_move_time
+from benchmark import category_of
+from instrumentation import DEFAULT_WINDOW, Histogram
+
+# reads the game logs bot.py --log writes. without an action it prints a summary of the
+# selected moves, --list prints them one by one, --search plays them again with a fresh bot
+# and --export writes them as a benchmark corpus (benchmark.py --corpus) or as JSON lines.
+
+
+def records(paths):
+    # every record of the logs in order, with whether a bomb went off since the last state of
+    # the same game. the logs are streamed, nothing is kept but the last record.
+    for path in paths:
+        previous = None
+        for record in read_log(path):
+            same_game = previous is not None and (previous.session, previous.game) == (record.session, record.game)
+            exploded_before = same_game and any(bomb["explode_in_round"] <= record.round for bomb in previous.bombs)
+            yield record, exploded_before
+            previous = record
+
+
+def selected(args):
+    for record, exploded_before in records(args.logs):
+        if args.session is not None and record.session != args.session:
+            continue
+        if args.game is not None and record.game != args.game:
+            continue
+        if args.round is not None and record.round != args.round:
+            continue
+        if args.late and not record.late:
+            continue
+        if args.slower_than is not None and record.think_ms <= args.slower_than:
+            continue
+        yield record, exploded_before
+
+
+def describe(record):
+    bombs = " ".join(f"({bomb['row']},{bomb['col']})@{bomb['explode_in_round']}" for bomb in record.bombs)
+    return (f"session {record.session} game {record.game:3} round {record.round:2} coin {record.coin_id} "
+            f"move {record.move:2} {record.think_ms:7.1f} ms{' late' if record.late else ''}"
+            f"{'  bombs ' + bombs if bombs else ''}")
+
+
+def research(record, bot_name, move_ms):
+    # the logged position searched again by a fresh bot, returns the move, the time and search_info
+    bot = ai_factory(bot_name)
+    set_move_time(bot, move_ms)
+    state = record.state()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started_at = perf_counter()
+            bot.start_clock(started_at)
+            move = bot.play(state)
+            elapsed = (perf_counter() - started_at) * 1000
+    finally:
+        bot.stop_pondering()
+    return move, elapsed, getattr(bot, "search_info", None) or {}
+
+
+def corpus_entry(record, category):
+    state = record.state()
+    return {"category": category, "game": record.game, "bot": record.bot, "coin_id": record.coin_id,
+            "round": record.round, "bombs": list(record.bombs), "board": state.board}
+
+
+def export(args):
+    # benchmark corpus: the categories of benchmark.py, the rest as "other". positions with a
+    # win on the board are left out, they are answered without a search.
+    count = 0
+    if args.format == "jsonl":
+        with open(args.export, "w") as file:
+            for record, _ in selected(args):
+                entry = corpus_entry(record, None)
+                del entry["category"]
+                entry.update(session=record.session, move=record.move, think_ms=record.think_ms, late=record.late)
+                file.write(json.dumps(entry) + "\n")
+                count += 1
+    else:
+        positions = []
+        for record, exploded_before in selected(args):
+            state = record.state()
+            if state.position.winning_moves(1) or state.position.winning_moves(2):
+                continue
+            positions.append(corpus_entry(record, category_of(state, exploded_before) or "other"))
+        with open(args.export, "w") as file:
+            json.dump({"source": args.logs, "positions": positions}, file, indent=1)
+        count = len(positions)
+    print(f"{count} positions -> {args.export}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reads the game logs of bot.py --log")
+    parser.add_argument("logs", nargs="+", help="log files, read in order")
+    parser.add_argument("--session", type=int, help="only this bot.py run of the log (1 = the first)")
+    parser.add_argument("--game", type=int, help="only this game of a session")
+    parser.add_argument("--round", type=int, help="only this round")
+    parser.add_argument("--late", action="store_true", help="only moves where the search missed the deadline")
+    parser.add_argument("--slower-than", type=float, metavar="MS", help="only moves that took longer than this")
+    parser.add_argument("--list", action="store_true", help="print every selected move")
+    parser.add_argument("--search", action="store_true", help="search the selected positions again")
+    parser.add_argument("--bot", default="StayinAlignAI", choices=sorted(ai_bots), help="bot for --search")
+    parser.add_argument("--move-ms", type=float, default=0,
+                        help="think time per move for --search (default: the bot's own)")
+    parser.add_argument("--export", help="write the selected positions to this file")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help="moves the percentiles are computed over, the last ones of the selection")
+    parser.add_argument("--format", choices=("benchmark", "jsonl"), default="benchmark",
+                        help="benchmark: a corpus for benchmark.py --corpus, jsonl: one position and move per line")
+    args = parser.parse_args(argv)
+
+    if args.export:
+        export(args)
+        return
+    # running aggregates only, the summary of a log of any size fits in the window
+    think_times = Histogram(args.window)
+    sessions = set()
+    games = 0
+    last_game = None
+    late = 0
+    changed = 0
+    for record, _ in selected(args):
+        think_times.add(record.think_ms)
+        sessions.add(record.session)
+        if (record.session, record.game) != last_game:
+            games += 1
+            last_game = (record.session, record.game)
+        late += record.late
+        if args.list or args.search:
+            print(describe(record))
+        if args.search:
+            move, elapsed, info = research(record, args.bot, args.move_ms)
+            changed += move != record.move
+            print(f"  {args.bot}: move {move} in {elapsed:.1f} ms, depth {info.get('depth')} "
+                  f"score {info.get('score')}{'  (differs)' if move != record.move else ''}")
+    times = think_times.summary()
+    print(f"{times['count']} moves in {games} games of {len(sessions)} sessions, {late} late, mean {times['mean']} "
+          f"max {times['max']} ms, last {min(times['count'], args.window)}: p50 {times['p50']} p95 {times['p95']} "
+          f"p99 {times['p99']} ms")
+    if args.search:
+        print(f"{changed} of {times['count']} moves differ from the log")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import websockets
+
+from Bots.aiFactory import ai_bots
+from Bots.simulator import GAMES_PER_MATCH, Game
+from Bots.time_manager import MOVE_TIMEOUT_MS
+from instrumentation import Histogram
+
+# stand-in for game/global/websocket_server.gd and game.gd without Godot: bots connect to
+# ws://localhost:<port>/<name>, every two connections play a match with the rules of
+# Bots/simulator.py, and the server measures the round trip of every move
+
+DEFAULT_PORT = 5051
+# the multiplayer peer of Godot sends a binary packet with the peer id right after the
+# handshake, the clients skip everything that is not a json object
+PING_FRAME = (1).to_bytes(4, "little")
+BOT_SCRIPT = Path(__file__).parent / "bot.py"
+# seconds a launched bot.py may take to connect
+LAUNCH_TIMEOUT = 30
+
+
+def requested_path(websocket):
+    # websockets 13+ keeps the handshake request, older versions only the path
+    request = getattr(websocket, "request", None)
+    return request.path if request is not None else websocket.path
+
+
+def state_payload(game: Game, name):
+    # game.gd _send_update_state, JSON.stringify sorts the keys and leaves out the spaces
+    payload = {
+        "bot": name,
+        "coin_id": game.to_move,
+        "round": game.current_turn,
+        "bombs": game.bombs_data(),
+        "board": game.position.to_board(),
+    }
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"))
+
+
+def column_of(message):
+    # the column of a {"state": "play", "column": n} reply, None if there is none
+    try:
+        column = json.loads(message)["column"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    if isinstance(column, float) and column.is_integer():
+        # JSON.parse_string of Godot reads every number as a float
+        column = int(column)
+    return column if isinstance(column, int) and not isinstance(column, bool) else None
+
+
+class Client:
+    # one connected bot, replies are stamped on arrival and wait in the inbox
+    def __init__(self, websocket, name):
+        self.websocket = websocket
+        self.name = name
+        self.inbox = asyncio.Queue()
+        self.closed = asyncio.Event()
+        self.round_trip = Histogram()
+        self.moves = 0
+        self.timeouts = 0
+        self.late_replies = 0
+        self.bad_replies = 0
+
+    async def receive(self):
+        try:
+            async for message in self.websocket:
+                self.inbox.put_nowait((perf_counter(), message))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.closed.set()
+
+    def drop_late_replies(self):
+        # answers that came after their timeout, websocket_server.gd discards them too
+        while not self.inbox.empty():
+            self.inbox.get_nowait()
+            self.late_replies += 1
+
+    def summary(self):
+        return {
+            "name": self.name,
+            "moves": self.moves,
+            "timeouts": self.timeouts,
+            "late_replies": self.late_replies,
+            "bad_replies": self.bad_replies,
+            "round_trip_ms": self.round_trip.summary(),
+        }
+
+
+class ServerMatch:
+    # best of games between two clients like game_manager.gd, the starting player alternates
+    def __init__(self, number, one: Client, two: Client, games, timeout_ms, seed, broadcast):
+        self.number = number
+        self.clients = (None, one, two)
+        self.games = games
+        self.timeout_ms = timeout_ms
+        self.rng = random.Random(seed)
+        self.broadcast = broadcast
+        self.score = [0, 0]
+        self.results = []
+
+    async def run(self):
+        first_player = 1
+        for _ in range(self.games):
+            result = await self.play_game(first_player)
+            if result is None:
+                break
+            for winner in result.winners:
+                self.score[winner - 1] += 1
+            self.results.append(result)
+            first_player = 3 - first_player
+        return self
+
+    async def play_game(self, first_player):
+        game = Game(first_player, self.rng)
+        while not game.over():
+            client = self.clients[game.to_move]
+            client.drop_late_replies()
+            frame = state_payload(game, client.name)
+            receivers = self.clients[1:] if self.broadcast else (client,)
+            sent_at = perf_counter()
+            try:
+                for receiver in receivers:
+                    await receiver.websocket.send(frame)
+            except websockets.ConnectionClosed:
+                return None
+            reply = await self.wait_reply(client, sent_at)
+            if reply is None:
+                if client.closed.is_set():
+                    return None
+                # game.gd player_got_timeout, the other player wins
+                client.timeouts += 1
+                game.timeout()
+                break
+            client.moves += 1
+            received_at, message = reply
+            client.round_trip.add((received_at - sent_at) * 1000)
+            column = column_of(message)
+            if column is None:
+                client.bad_replies += 1
+            # an invalid column is an illegal move, the other player wins
+            game.play(column)
+        return game.result
+
+    async def wait_reply(self, client: Client, sent_at):
+        remaining = self.timeout_ms / 1000 - (perf_counter() - sent_at) if self.timeout_ms else None
+        get = asyncio.ensure_future(client.inbox.get())
+        closed = asyncio.ensure_future(client.closed.wait())
+        try:
+            done, _ = await asyncio.wait((get, closed), timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+        if get in done:
+            return get.result()
+        get.cancel()
+        return None
+
+    def summary(self):
+        return {
+            "match": self.number,
+            "players": [self.clients[1].name, self.clients[2].name],
+            "score": self.score,
+            "games": [{"winners": result.winners, "reason": result.reason, "turns": result.turns}
+                      for result in self.results],
+            "clients": [self.clients[1].summary(), self.clients[2].summary()],
+        }
+
+
+class MatchServer:
+    # pairs the connections in the order they arrive, the first of a pair is player one
+    def __init__(self, matches, games, timeout_ms, seed, broadcast):
+        self.matches = matches
+        self.games = games
+        self.timeout_ms = timeout_ms
+        self.seed = seed
+        self.broadcast = broadcast
+        self.waiting = None
+        self.started = 0
+        self.connections = 0
+        self.connected = asyncio.Event()
+        self.finished = []
+        self.all_done = asyncio.Event()
+
+    async def handle(self, websocket):
+        if self.started >= self.matches:
+            await websocket.close()
+            return
+        client = Client(websocket, requested_path(websocket).rstrip("/").split("/")[-1])
+        print(f"client {client.name} connected")
+        self.connections += 1
+        self.connected.set()
+        await websocket.send(PING_FRAME)
+        receiver = asyncio.ensure_future(client.receive())
+        if self.waiting is None or self.waiting.closed.is_set():
+            self.waiting = client
+        else:
+            one = self.waiting
+            self.waiting = None
+            self.started += 1
+            match = ServerMatch(self.started, one, client, self.games, self.timeout_ms, self.seed + self.started,
+                                self.broadcast)
+            asyncio.ensure_future(self.run_match(match))
+        await client.closed.wait()
+        receiver.cancel()
+
+    async def run_match(self, match: ServerMatch):
+        await match.run()
+        summary = match.summary()
+        self.finished.append(summary)
+        print(f"match {match.number}: {summary['players'][0]} {match.score[0]} - "
+              f"{match.score[1]} {summary['players'][1]}")
+        for client in match.clients[1:]:
+            await client.websocket.close()
+        if len(self.finished) >= self.matches:
+            self.all_done.set()
+
+    def summary(self):
+        clients = [client for match in self.finished for client in match["clients"]]
+        return {
+            "matches": sorted(self.finished, key=lambda match: match["match"]),
+            "moves": sum(client["moves"] for client in clients),
+            "timeouts": sum(client["timeouts"] for client in clients),
+            "late_replies": sum(client["late_replies"] for client in clients),
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"{len(self.finished)} matches, {summary['moves']} moves, {summary['timeouts']} timeouts, "
+              f"{summary['late_replies']} late replies")
+        for match in summary["matches"]:
+            for client in match["clients"]:
+                round_trip = client["round_trip_ms"]
+                print(f"  match {match['match']} {client['name']:16} moves {client['moves']:4}  "
+                      f"timeouts {client['timeouts']}  p50 {round_trip['p50']:7.2f}  p95 {round_trip['p95']:7.2f}  "
+                      f"p99 {round_trip['p99']:7.2f}  max {round_trip['max']:7.2f} ms")
+
+
+async def launch_bots(server: MatchServer, bots, port, matches):
+    # two bot.py processes per match. each one is started once the one before has connected,
+    # so player one of every match is the first bot.
+    processes = []
+    for _ in range(matches):
+        for name in bots:
+            connections = server.connections
+            server.connected.clear()
+            processes.append(subprocess.Popen([sys.executable, str(BOT_SCRIPT), name, str(port)],
+                                              cwd=BOT_SCRIPT.parent, stdout=subprocess.DEVNULL))
+            while server.connections == connections:
+                await asyncio.wait_for(server.connected.wait(), LAUNCH_TIMEOUT)
+    return processes
+
+
+async def serve(args):
+    server = MatchServer(args.matches, args.games, args.timeout_ms, args.seed, args.broadcast)
+    async with websockets.serve(server.handle, "localhost", args.port, ping_interval=None, ping_timeout=None):
+        print(f"listening on ws://localhost:{args.port}/<BotName> for {args.matches} matches")
+        processes = await launch_bots(server, args.launch, args.port, args.matches) if args.launch else []
+        try:
+            await server.all_done.wait()
+        finally:
+            for process in processes:
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+    server.print_summary()
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(server.summary(), file, indent=2)
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plays matches between bot.py clients like the Godot server")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--matches", type=int, default=1, help="matches to play, every two connections are a match")
+    parser.add_argument("--games", type=int, default=GAMES_PER_MATCH, help="games per match")
+    parser.add_argument("--timeout-ms", type=float, default=MOVE_TIMEOUT_MS,
+                        help="a reply slower than this loses the game, 0 disables")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the bomb turns, match i uses seed + i")
+    parser.add_argument("--broadcast", action="store_true",
+                        help="send every state to both bots like websocket_server.gd, not only to the active one")
+    parser.add_argument("--launch", nargs=2, metavar=("BOT_ONE", "BOT_TWO"), choices=sorted(ai_bots),
+                        help="start a bot.py pair per match instead of waiting for clients")
+    parser.add_argument("--json", help="write the results and latencies to this file")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import asdict
+from time import perf_counter
+
+from Bots.evaluation import EvalWeights
+from Bots.simulator import play_game, set_move_time
+from Bots.stayinalign_ai import StayinAlignAI
+from Bots.weights import WEIGHTS_PATH, load_weights, save_weights
+
+# SPSA over the EvalWeights of StayinAlignAI. every step draws a random +-1 per weight, plays a
+# game pair (same bomb seed, both seats) between theta + c*delta and theta - c*delta and moves
+# theta towards the side that won. the steps run asynchronously like fishtest: every finished
+# pair updates theta at once and the next pair starts from the new theta, so no worker waits
+# for the slowest game of a batch.
+
+# per weight: (c at the last step, lowest value, highest value). c is the perturbation in
+# points, at least 1 because the weights are ints. the win score of the search (WIN_SCORE) is
+# not tuned, it is the scale all the other weights are measured against.
+PARAMETERS = {
+    "win": (5, 1, 200),
+    "double_threat": (2, 0, 100),
+    "threat": (1, 0, 50),
+    "parity": (1, 0, 50),
+    "bomb": (3, 0, 100),
+}
+# the usual SPSA exponents (Spall), A is a tenth of the steps
+ALPHA = 0.602
+GAMMA = 0.101
+CHECKPOINT = "tune_checkpoint.json"
+# transposition table per bot, two bots per worker process
+WORKER_TT_MB = 4
+
+_bots = None
+
+
+def _start_worker(move_ms, tt_size_mb):
+    # the two bots of a worker live as long as the process, only their weights change per pair
+    global _bots
+    _bots = []
+    for _ in range(2):
+        bot = StayinAlignAI(tt_size_mb=tt_size_mb, ponder=False, opening_book=None)
+        set_move_time(bot, move_ms)
+        _bots.append(bot)
+
+
+def play_pair(plus, minus, seed, timeout_ms):
+    # plus against minus twice with the same bombs, plus starts the first game. returns the
+    # wins minus the losses of plus, a game both players win counts for neither.
+    bot_plus, bot_minus = _bots
+    bot_plus.weights = EvalWeights(**plus)
+    bot_minus.weights = EvalWeights(**minus)
+    result = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for plus_coin in (1, 2):
+            players = (bot_plus, bot_minus) if plus_coin == 1 else (bot_minus, bot_plus)
+            game = play_game(*players, first_player=1 if plus_coin == 1 else 2, rng=random.Random(seed),
+                             timeout_ms=timeout_ms)
+            if len(game.winners) == 1:
+                result += 1 if game.winners[0] == plus_coin else -1
+    return result
+
+
+class Spsa:
+    # theta is a float per weight, the bots play with the rounded values
+    def __init__(self, theta, steps, learning_rate):
+        self.theta = dict(theta)
+        self.steps = steps
+        self.learning_rate = learning_rate
+        self.step = 0
+        self.games = 0
+        self.score = 0
+        self.trace = []
+
+    def gains(self, step, name):
+        # c and a of the step, set up so that the last step perturbs by c_end and moves by
+        # about learning_rate * c_end^2 per game point (fishtest's r_end)
+        c_end = PARAMETERS[name][0]
+        stability = 0.1 * self.steps
+        c = c_end * self.steps ** GAMMA / (step + 1) ** GAMMA
+        a = self.learning_rate * c_end ** 2 * (stability + self.steps) ** ALPHA / (stability + step + 1) ** ALPHA
+        return c, a
+
+    def perturb(self, step, rng):
+        # the weights of both sides and what update() needs to move theta afterwards
+        plus, minus, delta = {}, {}, {}
+        for name, value in self.theta.items():
+            c, _ = self.gains(step, name)
+            low, high = PARAMETERS[name][1:]
+            delta[name] = rng.choice((-1, 1))
+            plus[name] = min(high, max(low, round(value + c * delta[name])))
+            minus[name] = min(high, max(low, round(value - c * delta[name])))
+        return plus, minus, {"step": step, "delta": delta}
+
+    def update(self, job, result):
+        for name in self.theta:
+            c, a = self.gains(job["step"], name)
+            low, high = PARAMETERS[name][1:]
+            self.theta[name] = min(high, max(low, self.theta[name] + a / c * result * job["delta"][name]))
+        self.step += 1
+        self.games += 2
+        self.score += result
+
+    def weights(self):
+        return EvalWeights(**{name: round(value) for name, value in self.theta.items()})
+
+    def as_dict(self):
+        return {"steps": self.steps, "learning_rate": self.learning_rate, "step": self.step, "games": self.games,
+                "score": self.score, "theta": self.theta, "trace": self.trace}
+
+    @classmethod
+    def from_dict(cls, data):
+        spsa = cls(data["theta"], data["steps"], data["learning_rate"])
+        spsa.step = data["step"]
+        spsa.games = data["games"]
+        spsa.score = data["score"]
+        spsa.trace = data["trace"]
+        return spsa
+
+
+def save_checkpoint(path, spsa: Spsa, rng, seed, next_step, pending):
+    # written next to the old one and renamed, an interrupted write keeps the last checkpoint.
+    # pending are the pairs still being played as (plus, minus, job), a rerun plays them again
+    # with the same weights and seeds before it draws new steps.
+    state = rng.getstate()
+    data = {"seed": seed, "spsa": spsa.as_dict(), "rng": [state[0], list(state[1]), state[2]],
+            "next_step": next_step, "pending": [list(pair) for pair in pending]}
+    with open(path + ".tmp", "w") as file:
+        json.dump(data, file)
+    os.replace(path + ".tmp", path)
+
+
+def load_checkpoint(path):
+    with open(path) as file:
+        data = json.load(file)
+    rng = random.Random()
+    version, internal, gauss = data["rng"]
+    rng.setstate((version, tuple(internal), gauss))
+    spsa = Spsa.from_dict(data["spsa"])
+    return spsa, rng, data["seed"], data.get("next_step", spsa.step), [tuple(pair) for pair in data.get("pending", ())]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tunes the evaluation weights of StayinAlignAI with SPSA self play")
+    parser.add_argument("--steps", type=int, default=5000, help="game pairs to play in total")
+    parser.add_argument("--learning-rate", type=float, default=0.002,
+                        help="step size at the end of the run in units of c_end^2 per game point")
+    parser.add_argument("--move-ms", type=float, default=20, help="think time per move")
+    parser.add_argument("--timeout-ms", type=float, default=0, help="forfeit moves slower than this, 0 disables")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--tt-mb", type=int, default=WORKER_TT_MB, help="transposition table per bot")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--start", default=WEIGHTS_PATH, help="weights to start from (default: the bot's own)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT, help="state of the run, a rerun continues from it")
+    parser.add_argument("--checkpoint-every", type=int, default=20, help="game pairs between checkpoints")
+    parser.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--output", default=WEIGHTS_PATH, help="where the tuned weights are written")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.checkpoint) and not args.fresh:
+        spsa, rng, seed, next_step, pending = load_checkpoint(args.checkpoint)
+        spsa.steps = args.steps
+        print(f"continuing {args.checkpoint} at step {spsa.step}, {len(pending)} pairs to replay", file=sys.stderr)
+    else:
+        theta = {name: float(value) for name, value in asdict(load_weights(args.start)).items()}
+        spsa, rng, seed = Spsa(theta, args.steps, args.learning_rate), random.Random(args.seed), args.seed
+        next_step, pending = 0, []
+    timeout_ms = args.timeout_ms or None
+    started_at = perf_counter()
+    games_before = spsa.games
+    since_checkpoint = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_start_worker,
+                             initargs=(args.move_ms, args.tt_mb)) as pool:
+        # one pair more per worker than there are workers, so every worker has the next one ready
+        # future -> (plus, minus, job)
+        running = {}
+
+        def submit(plus=None, minus=None, job=None):
+            nonlocal next_step
+            if job is None:
+                plus, minus, job = spsa.perturb(next_step, rng)
+                next_step += 1
+            running[pool.submit(play_pair, plus, minus, seed + job["step"], timeout_ms)] = (plus, minus, job)
+
+        for pair in pending:
+            submit(*pair)
+        while next_step < args.steps and len(running) < args.workers * 2:
+            submit()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                spsa.update(running.pop(future)[2], future.result())
+                since_checkpoint += 1
+                if next_step < args.steps:
+                    submit()
+            if since_checkpoint >= args.checkpoint_every or not running:
+                spsa.trace.append({"step": spsa.step, **{name: round(value, 2) for name, value in spsa.theta.items()}})
+                save_checkpoint(args.checkpoint, spsa, rng, seed, next_step, running.values())
+                since_checkpoint = 0
+            games = spsa.games - games_before
+            theta = " ".join(f"{name} {value:.1f}" for name, value in spsa.theta.items())
+            print(f"\rstep {spsa.step}/{args.steps}  {games / (perf_counter() - started_at):.1f} games/s  {theta}",
+                  end="", file=sys.stderr)
+    print(file=sys.stderr)
+
+    weights = spsa.weights()
+    save_weights(weights, args.output)
+    print(f"{spsa.games} games, plus side {spsa.score:+d}: {asdict(weights)} -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()